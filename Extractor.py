@@ -26,6 +26,7 @@ class Extractor:
         self.continue_run = False if params.continue_run is None else params.continue_run
         self.logger = create_log_handler("logs_extractor_main.log")
         self.save_path = f"{DEFAULT_EXTRACTED_OUTPUT}/{self.repo_name}" if params.save_path is None else params.save_path 
+        self.compression = COMPRESSION_EXTENSIONS.get(getattr(params, "compression", None), "")
 
         if not os.path.exists(self.save_path):
             os.mkdir(self.save_path)
@@ -49,17 +50,16 @@ class Extractor:
                 features_extractor.load_state(self.save_path)
                 
             iterator = load_jsonl(self.file_path)
-            for commit in tqdm(iterator, "Processing Kamei14 Features:"):
-                line = [features_extractor.process(commit)]
-                append_jsonl(line, f"{self.save_path}/features-{self.repo_name}.jsonl")
-                if line[0]["fix"]:
-                    append_jsonl(
-                        [{
+            with JsonlWriter(f"{self.save_path}/features-{self.repo_name}.jsonl{self.compression}") as features, \
+                    JsonlWriter(f"{self.save_path}/security-{self.repo_name}.jsonl{self.compression}") as security:
+                for commit in tqdm(iterator, "Processing Kamei14 Features:"):
+                    line = [features_extractor.process(commit)]
+                    features.write(line[0])
+                    if line[0]["fix"]:
+                        security.write({
                             "commit_id": line[0]["commit_id"],
                             "Repository": self.repo_name
-                        }], 
-                        f"{self.save_path}/security-{self.repo_name}.jsonl"
-                    )
+                        })
             features_extractor.save_state(self.save_path)
         except Exception as e:
             print(line)
@@ -76,7 +76,7 @@ class Extractor:
             for commit in tqdm(iterator, "Processing VCCFinder Features:"):
                 features_extractor.absorb(commit)
             features_extractor.save_state(self.save_path)
-            features_extractor.release(f"{self.save_path}/vcc-features-{self.repo_name}.jsonl")
+            features_extractor.release(f"{self.save_path}/vcc-features-{self.repo_name}.jsonl{self.compression}")
         except Exception as e:
             print(line)
             self.logger.error(traceback.format_exc())
@@ -119,6 +119,8 @@ class Extractor:
             code_dict.load_state(self.save_path)
             
         iterator = load_jsonl(self.file_path)
+        deepjit_writer = JsonlWriter(f"{self.save_path}/deepjit-{self.repo_name}.jsonl{self.compression}")
+        simcom_writer = JsonlWriter(f"{self.save_path}/simcom-{self.repo_name}.jsonl{self.compression}")
         for commit in tqdm(iterator, "Processing Commits:"):
             id, message, added_codes, deleted_codes, patch_codes = self.process_one_commit(commit)
             deepjit = {
@@ -132,8 +134,8 @@ class Extractor:
                 "code_change": "\n".join(patch_codes)
             }
             try:
-                append_jsonl([deepjit], f"{self.save_path}/deepjit-{self.repo_name}.jsonl")
-                append_jsonl([simcom], f"{self.save_path}/simcom-{self.repo_name}.jsonl")
+                deepjit_writer.write(deepjit)
+                simcom_writer.write(simcom)
 
                 for word in message.split():
                     msg_dict.add(word)
@@ -145,22 +147,30 @@ class Extractor:
                 self.logger.error(e)
                 self.logger.error(traceback.format_exc()) 
                 exit()
+        deepjit_writer.close()
+        simcom_writer.close()
                 
         msg_dict.save_state(self.save_path)
         code_dict.save_state(self.save_path)
         
         pruned_msg_dict = msg_dict.prune(100000)
         pruned_code_dict = code_dict.prune(100000)
-        save_jsonl([pruned_msg_dict.get_dict(), pruned_code_dict.get_dict()], f"{self.save_path}/dict-{self.repo_name}.jsonl")   
+        save_jsonl([pruned_msg_dict.get_dict(), pruned_code_dict.get_dict()], f"{self.save_path}/dict-{self.repo_name}.jsonl{self.compression}")   
 
 if __name__ == "__main__":
+    import argparse
     from argparse import Namespace
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--compression", type=str, default=None, choices=list(COMPRESSION_EXTENSIONS), help="Compress the JSONL feature outputs")
+    params = parser.parse_args()
     
     def get_cfg(repo, continue_run):
         cfg = {
             "repo_name": repo,
             "continue_run": continue_run,
-            "save_path": None
+            "save_path": None,
+            "compression": params.compression
         }
         cfg = Namespace(**cfg)
         return cfg
@@ -155,13 +155,13 @@ def merge_class_files(temp_files: List, output_files: Dict, part: str) -> None:
     for dataset in ["train", "val", "test"]:
         for setup in range(5):
             output_file = output_files[part][dataset][setup]
-            with open(output_file, 'w') as f_out:
+            with open_file(output_file, 'w') as f_out:
                 for temp_file in class_files[part][dataset][setup]:
                     with open(temp_file, 'r') as f_in:
                         f_out.write(f_in.read())
                             
 def read_file_in_chunks(filename, chunk_size=2000):
-    with open(filename, 'r') as file:
+    with open_file(filename, 'r') as file:
         while True:
             lines = [file.readline() for _ in range(chunk_size)]
             lines = list(filter(None, lines))
@@ -170,7 +170,7 @@ def read_file_in_chunks(filename, chunk_size=2000):
             lines = [json.loads(line) for line in lines]
             yield lines
                             
-def to_dataset(project: str, out_folder: str, label0s: List[List[List]], label1s: List[List[List]], workers: int=8) -> None:
+def to_dataset(project: str, out_folder: str, label0s: List[List[List]], label1s: List[List[List]], workers: int=8, compression: str="") -> None:
     for setup in range(5):
         if not os.path.exists(f"{out_folder}/SETUP{setup+1}/unsampling"):
             os.makedirs(f"{out_folder}/SETUP{setup+1}/unsampling")
@@ -190,9 +190,9 @@ def to_dataset(project: str, out_folder: str, label0s: List[List[List]], label1s
     
     output_files = { 
         part: {
-                "train": {setup : f"{out_folder}/SETUP{setup+1}/unsampling/SETUP{setup+1}-{project}-{part}-train.jsonl" for setup in range(5)},
-                "val": {setup : f"{out_folder}/SETUP{setup+1}/SETUP{setup+1}-{project}-{part}-val.jsonl" for setup in range(5)},
-                "test": {setup : f"{out_folder}/SETUP{setup+1}/SETUP{setup+1}-{project}-{part}-test.jsonl" for setup in range(5)}
+                "train": {setup : f"{out_folder}/SETUP{setup+1}/unsampling/SETUP{setup+1}-{project}-{part}-train.jsonl{compression}" for setup in range(5)},
+                "val": {setup : f"{out_folder}/SETUP{setup+1}/SETUP{setup+1}-{project}-{part}-val.jsonl{compression}" for setup in range(5)},
+                "test": {setup : f"{out_folder}/SETUP{setup+1}/SETUP{setup+1}-{project}-{part}-test.jsonl{compression}" for setup in range(5)}
             } 
         for part in ["features", "simcom", "deepjit", "vcc-features"]
     }
@@ -308,7 +308,8 @@ def run(params):
     
     log.info("To Dataset")
     try:
-        to_dataset(project, output_folder, label0s, label1s, params.workers)     
+        compression = COMPRESSION_EXTENSIONS.get(params.compression, "")
+        to_dataset(project, output_folder, label0s, label1s, params.workers, compression)     
         log.info("Complete!")
     except Exception as e:
         log.error(traceback.format_exc())
@@ -323,5 +324,6 @@ if __name__ == "__main__":
     parser.add_argument("--project", type=str, required=True)
     parser.add_argument("--workers", type=int, default=8)
     parser.add_argument("--continue_run", action="store_true")
+    parser.add_argument("--compression", type=str, default=None, choices=list(COMPRESSION_EXTENSIONS))
     params = parser.parse_args()
     run(params)
@@ -1,15 +1,28 @@
-from git import Repo, Commit
-from typing import Dict, List
+from git import Repo, Commit, GitCommandError
+from typing import Dict, Generator, Iterator, List, Optional, Set, Tuple
 from datetime import datetime, timezone
 from tqdm import tqdm
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from collections import deque
 import json
+import re
 import traceback
 import logging as logger
 import os, shutil
+import subprocess
+import multiprocessing
 import heapq
+import time
+import asyncio
+import gc
 
+from szz.szz.common.object_reader import ObjectReader
+from szz.szz.common.git_backend import GIT_BACKENDS, blame_args, create_git_backend, show_args
 from utils.aggregator import *
+from utils.blame import BlameCache, IncrementalBlame, deleted_lines, line_ranges
+from utils.records import RECORD_EXTENSION, RecordReader, RecordWriter, index_path, is_record_file
+from utils.stats import CommitStats, MinerStats
+from utils.shards import SHARD_MANIFEST_NAME, merge_shard_outputs, parse_shard, shard_bounds, write_shard_manifest
 from utils.line_parser import *
 from utils.utils import *
 
@@ -30,6 +43,75 @@ EXT2LANG = {
     # Add more extensions and programming languages as needed
 }
 
+def file_language(file_name: str) -> Optional[str]:
+    """
+    Language of a file from EXT2LANG, None if its extension is unknown.
+    """
+    try:
+        file_extension = file_name.rsplit(".")[1].lower()
+    except:
+        file_extension = None
+    return EXT2LANG.get(file_extension, None)
+
+def parse_languages(language: str) -> List[str]:
+    """
+    Languages of a comma-separated `--language`, e.g. "C,C++", in their given spelling.
+    """
+    languages = []
+    for lang in (language or "").split(","):
+        lang = lang.strip()
+        if lang and lang.lower() not in [known.lower() for known in languages]:
+            languages.append(lang)
+    return languages
+
+def read_commit_ids(files: List[str]) -> Set[str]:
+    """
+    Commits selected by label files: the "VFC" of every line of a JSONL label file (its
+    "commit_id" without one), every id of a JSON array such as `vfc.json`, or every line of
+    a plain list of commit ids. Raises ValueError for a file without any full commit id.
+    """
+    commit_ids = set()
+    for file in files:
+        file_ids = set()
+        with open_file(file, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("{"):
+                    record = json.loads(line)
+                    file_ids.add(record.get("VFC", record.get("commit_id")))
+                elif line.startswith("["):
+                    file_ids.update(json.loads(line))
+                elif line:
+                    file_ids.add(line)
+        file_ids = {commit_id for commit_id in file_ids if isinstance(commit_id, str) and COMMIT_ID.fullmatch(commit_id)}
+        if not file_ids:
+            raise ValueError(f"No 40-hex commit id in {file}")
+        commit_ids |= file_ids
+    return commit_ids
+
+def language_pathspecs(language: str) -> List[str]:
+    """
+    Git pathspecs matching every path that the EXT2LANG filter of `process_commit_log`
+    can accept for `language`: its extension check reads the first dot-separated part
+    after the first dot, so `*.c.*` is needed next to `*.c`.
+    """
+    pathspecs = []
+    for ext, lang in EXT2LANG.items():
+        if lang.lower() == language.lower():
+            pathspecs += [f":(icase)*.{ext}", f":(icase)*.{ext}.*"]
+    return pathspecs
+
+COMMIT_FORMAT = "%H%n%P%n%an%n%ct%n%s%n%B%n[MODIFIED]"
+COMMIT_ID = re.compile(r"[0-9a-f]{40}")
+# Every record of the streamed `git log` starts with a NUL byte, which can
+# neither appear in a commit message nor start a diff line.
+COMMIT_SEPARATOR = "\x00"
+# Rough size of a source line, to estimate a bounded-context diff from its `--numstat` line counts
+AVERAGE_LINE_BYTES = 40
+# Peak worker memory per estimated byte of `git show` output (about 5 measured on whole-file
+# diffs): the output lines, the parsed chunks and the encoded record
+MEMORY_FACTOR = 6
+
 class Miner:
     def __init__(self, params):
         self.url = params.url
@@ -37,8 +119,56 @@ class Miner:
         self.workers = params.workers
         self.start = params.start
         self.end = params.end
+        self.stream = getattr(params, "stream", False)
+        self.bytes_diff = getattr(params, "bytes_diff", False)
+        self.decode_errors = getattr(params, "decode_errors", None) or "surrogateescape"
+        self.git_backend = getattr(params, "git_backend", None) or "gitpython"
+        self.blame = not getattr(params, "no_blame", False)
+        self.incremental_blame = getattr(params, "incremental_blame", False)
+        self.blame_ranges = getattr(params, "blame_ranges", False)
+        self.blame_cache_dir = getattr(params, "blame_cache", None)
+        self.blame_cache_size = getattr(params, "blame_cache_size", None) or 1024
+        self.records = getattr(params, "records", False)
+        self.slotted = getattr(params, "slotted", False)
+        self.async_git = getattr(params, "async_git", None) or 0
+        self.top_slowest = getattr(params, "top_slowest", None) or 20
+        self.stats = MinerStats(self.top_slowest)
+        self.compression = COMPRESSION_EXTENSIONS.get(getattr(params, "compression", None), "")
+        self.context = getattr(params, "context", None)
+        if self.context is not None and self.context < 1:
+            # Without context lines `aggregator` merges neighbouring changes into one chunk
+            raise ValueError("--context must be at least 1 to keep the extracted features unchanged")
+        self.unified = 999999999 if self.context is None else self.context
+        self.rev = getattr(params, "rev", None) or "HEAD"
+        self.tip = None
+        # Commits whose history is left out of the enumeration, the tip of the last run with --follow
+        self.exclude = []
+        self.follow = getattr(params, "follow", False)
+        self.fetch = getattr(params, "fetch", False)
+        self.shard = parse_shard(params.shard) if getattr(params, "shard", None) else None
+        self.since = getattr(params, "since", None)
+        self.until = getattr(params, "until", None)
+        self.first_parent = getattr(params, "first_parent", False)
+        self.no_merges = getattr(params, "no_merges", False)
+        self.commit_graph = getattr(params, "commit_graph", False)
+        if self.follow and (self.shard is not None or self.start is not None or self.end is not None):
+            raise ValueError("--follow mines every commit up to the tip, it cannot be combined with --shard, --start or --end")
+        if self.async_git > 0 and (self.git_backend != "gitpython" or self.stream or self.bytes_diff):
+            # The asyncio path runs its own `git show`/`git blame` processes and decodes them as text
+            raise ValueError("--async_git runs git subprocesses itself, it cannot be combined with --git_backend, --stream or --bytes_diff")
+        self.languages = parse_languages(getattr(params, "language", None))
+        self.language_keys = {language.lower(): language for language in self.languages}
+        if not self.languages:
+            raise ValueError("--language needs at least one language, e.g. C or C,C++")
         
         self.num_commits_per_files = 1000
+        self.batch_size = getattr(params, "batch_size", None) or 64
+        giant_commit_size = getattr(params, "giant_commit_size", 256)
+        self.giant_commit_size = 256 if giant_commit_size is None else giant_commit_size
+        self.giant_workers = getattr(params, "giant_workers", None) or 1
+        self.memory_budget = getattr(params, "memory_budget", None)
+        self.worker_id = 0
+        self.worker_logger = None
         self.logger = create_log_handler("logs_miner_main.log")
         self.repo_name = None
 
@@ -60,7 +190,13 @@ class Miner:
                 self.logger.info(f"{e}")         
         try:
             self.repo = Repo(self.repo_path)
-            self.languages = params.language
+            self.objects = ObjectReader(self.repo_path)
+            self.git = create_git_backend(self.git_backend, self.repo_path)
+            self.blame_engine = IncrementalBlame(self.repo_path) if self.incremental_blame and self.blame else None
+            self.blame_cache = BlameCache(self.blame_cache_dir, self.blame_cache_size << 20) if self.blame_cache_dir else None
+            self.pathspecs = [
+                pathspec for language in self.languages for pathspec in language_pathspecs(language)
+            ] if getattr(params, "pathspec", False) else []
             # self.logger.info(params.language)
         except Exception as e:
             self.logger.error(f"Catch error: {e}")
@@ -69,31 +205,347 @@ class Miner:
         if self.repo_name is None:
             self.repo_name = self.repo.remotes.origin.url.rstrip('/').split('/')[-1].replace('.git', '')
         
-        self.save_path = f"{DEFAULT_OUTPUT}/{self.repo_name}"        
+        output_path = getattr(params, "output_path", None) or DEFAULT_EXTRACTED_OUTPUT
+        self.save_path = f"{output_path}/{self.repo_name}"        
         if not os.path.exists(self.save_path):
             os.mkdir(self.save_path)
+        # One output stream per language, each with its own shards and manifest. A single
+        # language keeps the layout of the repository's output directory.
+        self.streams = {}
+        for language in self.languages:
+            save_path = self.save_path if len(self.languages) == 1 else f"{self.save_path}/{language}"
+            os.makedirs(save_path, exist_ok=True)
+            self.streams[language] = (save_path, f"{save_path}/manifest-{self.repo_name}.jsonl")
+        self.shard_files = {}
+        self.tip_file = f"{self.save_path}/tip-{self.repo_name}.json"
     
     def run(self):
+        """
+        Mine the commits, then merge the shards of every language stream into its output file.
+        :returns str the output file, {language: output file} when mining several languages
+        """
         if not os.path.exists(self.save_path):
             os.makedirs(self.save_path)
 
-        result = self.process_parallel()
+        started = time.perf_counter()
+        state = self.start_follow() if self.follow else None
+        shards = self.process_parallel()
+        self.logger.info(f"Shards written by this run: {shards}")
+
+        append = bool(self.exclude) and self.in_date_order(state)
+        if self.exclude and not append:
+            self.logger.info("New commits are dated before the end of the outputs, rebuild them from every commit of the tip")
+            self.exclude = []
+            self.commits = self.enumerate_commits()
+            self.commits.reverse()
+        if self.follow:
+            # Undone by the next run if this one stops before saving the new tip
+            if append:
+                state["pending"] = {language: self.output_sizes(self.output_file(language)) for language in self.streams}
+            else:
+                # The first run has no tip yet, the pinned one is kept for the log of the next run
+                state = dict(state or {}, rebuild=True, target=self.tip)
+            self.save_tip(state)
         
-        if self.start is not None and self.end is not None:
-            out_file = f"{self.save_path}/extracted-all-{self.repo_name}-start-{self.start}-end-{self.end}.jsonl"
+        out_files = {}
+        for language, (save_path, manifest_file) in self.streams.items():
+            out_file = self.output_file(language)
+            if append:
+                self.append_output(self.commits, out_file, language)
+            else:
+                self.merge_shards(self.commits, out_file, language)
+            out_files[language] = out_file
+
+            if self.shard is not None:
+                index, count = self.shard
+                write_shard_manifest(
+                    out_file, f"{save_path}/{SHARD_MANIFEST_NAME.format(self.repo_name, index, count)}",
+                    repo=self.repo_name, tip=self.tip, shard=index, shards=count, total=self.total_commits,
+                    start=self.shard_start, end=self.shard_end,
+                    first_commit=self.commits[0] if self.commits else None,
+                    last_commit=self.commits[-1] if self.commits else None,
+                    options={
+                        "language": language, "context": self.context, "pathspec": bool(self.pathspecs),
+                        "since": self.since, "until": self.until, "first_parent": self.first_parent, "no_merges": self.no_merges,
+                        "blame": self.blame, "blame_ranges": self.blame_ranges, "blame_cache": self.blame_cache is not None,
+                        "decode_errors": self.decode_errors if self.bytes_diff else None,
+                        "start": self.start, "end": self.end,
+                    },
+                )
+
+        out_file = out_files[self.languages[0]]
+        out_name = self.output_name()
+        extra = {}
+        if self.blame_cache is not None:
+            hits, misses = self.stats.counters.get("blame_cache_hits", 0), self.stats.counters.get("blame_cache_misses", 0)
+            removed, size = self.blame_cache.evict()
+            extra["blame_cache"] = {
+                "hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+                "evicted": removed, "bytes": size,
+            }
+            self.logger.info(f"Blame cache: {extra['blame_cache']}")
+        if len(self.streams) > 1:
+            extra["outputs"] = {language: os.path.relpath(path, self.save_path) for language, path in out_files.items()}
+        save_json(self.stats.summary(
+            repo=self.repo_name, output=os.path.basename(out_file), workers=self.workers,
+            wall_seconds=round(time.perf_counter() - started, 6), **extra,
+        ), f"{self.save_path}/summary-{out_name}.json")
+        self.logger.info(f"Run summary saved to {self.save_path}/summary-{out_name}.json")
+
+        if self.follow:
+            outputs = {}
+            for language, out_file in out_files.items():
+                manifest = self.load_manifest(language)
+                dates = [manifest[commit_id]["date"] for commit_id in self.commits if manifest.get(commit_id, {}).get("file")]
+                if append and state["outputs"][language]["last_date"] is not None:
+                    dates.append(state["outputs"][language]["last_date"])
+                outputs[language] = {"file": os.path.basename(out_file), "last_date": max(dates, default=None)}
+            self.save_tip({"rev": self.rev, "tip": self.tip, "updated": datetime.now(timezone.utc).isoformat(), "outputs": outputs})
+            self.logger.info(f"Outputs follow {self.rev} up to {self.tip}")
+        return out_file if len(self.streams) == 1 else out_files
+
+    def start_follow(self) -> Dict:
+        """
+        Pin the tip of `--follow` and choose what the run mines from the state of the last one.
+        The commits of `last tip..tip` are mined and appended when the last tip is an ancestor
+        of the new one. Otherwise (first run, force-push, or a rebuild left unfinished) every
+        commit of the tip is enumerated and the outputs are merged again: the manifests skip
+        the commits mined before, and the commits that a force-push removed drop out.
+        :returns Dict state of the last run, None on the first run
+        """
+        if self.fetch:
+            subprocess.run(["git", "-C", self.repo_path, "fetch", "--prune", "origin"], check=True)
+        self.tip = self.repo.commit(self.rev).hexsha
+        if not os.path.exists(self.tip_file):
+            self.logger.info(f"No mined tip in {self.tip_file}, mine every commit of {self.rev}")
+            return None
+
+        state = load_json(self.tip_file)
+        for language, (size, index_size) in state.pop("pending", {}).items():
+            # Appends of a run stopped before saving its tip
+            out_file = self.output_file(language)
+            if os.path.exists(out_file) and os.path.getsize(out_file) > size:
+                self.logger.info(f"Truncate {out_file} to the {size} bytes of the last saved tip")
+                os.truncate(out_file, size)
+            if index_size is not None and os.path.exists(index_path(out_file)):
+                os.truncate(index_path(out_file), index_size)
+
+        last_tip = state.get("tip")
+        if state.get("rebuild") or last_tip is None:
+            self.logger.info(f"Finish the rebuild of the outputs up to {state.get('target')} left by the last run")
+        elif subprocess.run(["git", "-C", self.repo_path, "merge-base", "--is-ancestor", last_tip, self.tip],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode != 0:
+            self.logger.warning(f"Mined tip {last_tip} is not an ancestor of {self.rev} ({self.tip}), it was force-pushed: rebuild the outputs")
+        else:
+            self.logger.info(f"Mine the commits of {last_tip}..{self.tip}")
+            self.exclude = [last_tip]
+        return state
+
+    def in_date_order(self, state: Dict) -> bool:
+        """
+        Whether the newly mined commits can be appended to the outputs of the last run, i.e.
+        none of them is dated before the last record of its output, as commits of a merged
+        branch can be.
+        """
+        for language in self.streams:
+            output = state.get("outputs", {}).get(language)
+            if output is None or not os.path.exists(self.output_file(language)):
+                return False
+            if output["last_date"] is None:
+                continue
+            manifest = self.load_manifest(language)
+            if any(manifest[commit_id]["date"] < output["last_date"] for commit_id in self.commits if manifest.get(commit_id, {}).get("file")):
+                return False
+        return True
+
+    def append_output(self, commit_ids: List[str], out_file: str, language: str) -> int:
+        """
+        Append the date-ordered records of `commit_ids` to an output. Compressed outputs get
+        a new gzip member or zstd frame, record files their records and index lines.
+        :returns int number of appended records
+        """
+        new_file = f"{os.path.dirname(out_file)}/follow-{generate_id()}-{os.path.basename(out_file)}"
+        count = self.merge_shards(commit_ids, new_file, language)
+        if count > 0 and is_record_file(out_file):
+            with RecordWriter(out_file) as writer:
+                for record in load_jsonl(new_file):
+                    writer.write(record)
+        elif count > 0:
+            with open(new_file, "rb") as src, open(out_file, "ab") as dst:
+                shutil.copyfileobj(src, dst)
+        if is_record_file(new_file) and os.path.exists(index_path(new_file)):
+            os.remove(index_path(new_file))
+        os.remove(new_file)
+        self.logger.info(f"Appended {count} records to {out_file}")
+        return count
+
+    @staticmethod
+    def output_sizes(out_file: str) -> Tuple[int, int]:
+        """
+        (size, index size or None) of an output, to undo the appends of an interrupted run.
+        """
+        size = os.path.getsize(out_file)
+        index_size = os.path.getsize(index_path(out_file)) if is_record_file(out_file) and os.path.exists(index_path(out_file)) else None
+        return size, index_size
+
+    def save_tip(self, state: Dict) -> None:
+        # Written aside then renamed, so that a stopped run leaves the previous state
+        tmp_file = f"{self.tip_file}.{generate_id()}.tmp"
+        save_json(state, tmp_file)
+        os.replace(tmp_file, self.tip_file)
+
+    def output_file(self, language: str) -> str:
+        """
+        Merged output of a language stream for the commit range of this run.
+        """
+        save_path = self.streams[language][0]
+        if self.shard is not None:
+            out_file = f"{save_path}/extracted-all-{self.repo_name}-shard-{self.shard[0]}-of-{self.shard[1]}.jsonl"
+        elif self.start is not None and self.end is not None:
+            out_file = f"{save_path}/extracted-all-{self.repo_name}-start-{self.start}-end-{self.end}.jsonl"
         elif self.start is not None:
-            out_file = f"{self.save_path}/extracted-all-{self.repo_name}-start-{self.start}.jsonl"
+            out_file = f"{save_path}/extracted-all-{self.repo_name}-start-{self.start}.jsonl"
         elif self.end is not None:
-            out_file = f"{self.save_path}/extracted-all-{self.repo_name}-end-{self.end}.jsonl"
+            out_file = f"{save_path}/extracted-all-{self.repo_name}-end-{self.end}.jsonl"
         else:
-            out_file = f"{self.save_path}/extracted-all-{self.repo_name}.jsonl"
-        save_jsonl(result, out_file)
+            out_file = f"{save_path}/extracted-all-{self.repo_name}.jsonl"
+        if self.records:
+            out_file = out_file[:-len(".jsonl")] + RECORD_EXTENSION
+        elif self.compression:
+            out_file += self.compression
         return out_file
 
-    def process_one_commit(self, commit_id: str, logger: logger.Logger) -> Dict:
-        "git show {commit_id} --name-only --pretty=format:%H%n%P%n%an%n%ct%n%s%n%B%n[MODIFIED]"
+    def output_name(self) -> str:
         """
-        Example output:
+        Output file name of the first language without its extensions, which names the run
+        summary and the blame sidecar. It is the output of a single-language run.
+        """
+        out_name = os.path.basename(self.output_file(self.languages[0]))
+        for extension in (self.compression, RECORD_EXTENSION, ".jsonl"):
+            if extension and out_name.endswith(extension):
+                out_name = out_name[:-len(extension)]
+        return out_name
+
+    def load_manifest(self, language: str = None) -> Dict[str, Dict]:
+        """
+        Read the manifest of mined commits stored next to the shards of a language stream,
+        the first one by default.
+        {
+            commit_id: {
+                "commit_id": str
+                "file": shard file name, None if the commit has no matching file
+                "date": commit date of the mined record
+            }
+        }
+        """
+        manifest = {}
+        manifest_file = self.streams[language or self.languages[0]][1]
+        if not os.path.exists(manifest_file):
+            return manifest
+        with open(manifest_file, "rb+") as f:
+            # Terminate a torn last line so that new records start on their own line
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+        with open(manifest_file, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn last line of a crashed run, the commit is mined again
+                    continue
+                manifest[record["commit_id"]] = record
+        return manifest
+
+    def merge_shards(self, commit_ids: List[str], out_file: str, language: str = None) -> int:
+        """
+        Write the mined records of `commit_ids` to `out_file` in date order with an on-disk
+        k-way merge of the shards listed in the manifest. Each shard is first copied into a
+        date-sorted run, then the runs are merged line by line, so only the keys of one shard
+        are ever held in memory. A commit mined twice (crash between shard and manifest
+        writes, overlapping --start/--end runs) is taken from the shard the manifest points to.
+        Only the shards of the given language stream are read, the first one by default.
+        """
+        wanted = set(commit_ids)
+        save_path = self.streams[language or self.languages[0]][0]
+        manifest = self.load_manifest(language)
+        shard_files = sorted({record["file"] for commit_id, record in manifest.items() if commit_id in wanted and record["file"]})
+
+        run_dir = f"{save_path}/merge-{generate_id()}"
+        os.makedirs(run_dir)
+        run_files = []
+        for shard_file in shard_files:
+            keys = []
+            with open(f"{save_path}/{shard_file}", "rb") as f:
+                offset = 0
+                for line in f:
+                    commit_id, date = self.shard_line_key(line, manifest)
+                    if commit_id in wanted and manifest.get(commit_id, {}).get("file") == shard_file:
+                        keys.append((date, offset, len(line)))
+                    offset += len(line)
+
+                keys.sort()
+                run_file = f"{run_dir}/{len(run_files)}.run"
+                with open(run_file, "wb") as run:
+                    for date, offset, length in keys:
+                        f.seek(offset)
+                        run.write(b"%d\t" % date + f.read(length).rstrip(b"\n") + b"\n")
+                run_files.append(run_file)
+
+        def read_run(run_file):
+            with open(run_file, "rb") as run:
+                for line in run:
+                    date, _, record = line.partition(b"\t")
+                    yield int(date), record
+
+        count = 0
+        runs = heapq.merge(*[read_run(run_file) for run_file in run_files], key=lambda x: x[0])
+        if is_record_file(out_file):
+            with RecordWriter(out_file, append=False) as writer:
+                for _, record in runs:
+                    writer.write(json.loads(record))
+                    count += 1
+        else:
+            # The workers are done by now, their CPUs compress the merged output
+            with open_file(out_file, "wb", threads=self.workers if self.workers > 1 else 0) as out:
+                for _, record in runs:
+                    out.write(record)
+                    count += 1
+        shutil.rmtree(run_dir)
+        return count
+
+    @staticmethod
+    def shard_line_key(line: bytes, manifest: Dict[str, Dict]) -> Tuple[str, int]:
+        """
+        (commit_id, date) of a shard line. Records start with their commit id, and the date
+        comes from the manifest, so the line is only decoded for older manifests.
+        """
+        if line[:15] == b'{"commit_id": "' and line[55:56] == b'"':
+            commit_id = line[15:55].decode()
+            date = manifest.get(commit_id, {}).get("date")
+            if date is not None:
+                return commit_id, date
+        try:
+            commit = json.loads(line)
+        except json.JSONDecodeError:
+            # Torn last line of a crashed run
+            return None, 0
+        return commit["commit_id"], commit["date"]
+
+    def count_lines(self, rev: str) -> int:
+        """
+        Number of lines of a blob, as many as `git blame` prints for it.
+        """
+        content = self.git.read_blob(rev)
+        return content.count(b"\n") + (0 if not content or content.endswith(b"\n") else 1)
+
+    def process_one_commit(self, commit_id: str, logger: logger.Logger, timing: CommitStats = None) -> Dict:
+        "git cat-file --batch <<< {commit_id}"
+        """
+        The commit object is read through the persistent `git cat-file` process and
+        rendered like `git show {commit_id} --pretty=format:{COMMIT_FORMAT}`:
         Commit ID:      76137d3f1906af4afc18ccd62336d85cbc0c56a4
         Parents ID:     70ce2ed39fdb4057392ca9a584e1e47938e27ef3
         Authour:        Mr-Duo
@@ -101,19 +553,14 @@ class Miner:
         Subject:        stuff
         Message:        stuff
         [MODIFIED]
-        Modified Files: defectguard/JITCrawler/core/utils/utils.py
         """
 
-        show_msg = self.repo.git.show(commit_id, name_only=True, pretty='format:%H%n%P%n%an%n%ct%n%s%n%B%n[MODIFIED]').splitlines()
-        files_index = show_msg.index('[MODIFIED]')
-        subject = show_msg[4]
-        head = show_msg[:5]
-        commit_msg = show_msg[5:files_index]
+        if self.bytes_diff:
+            return self.process_streamed_commit(commit_id, logger, timing)
 
-        parent_id = head[1]
-        author = head[2]
-        commit_date = head[3]
-        commit_msg = " ".join(commit_msg)
+        timing = timing or CommitStats(commit_id)
+        with timing.stage("header"):
+            show_msg = self.render_header(commit_id)
 
         "git show {commit_id} --pretty=format: --unified=999999999"
         """
@@ -126,19 +573,172 @@ class Miner:
         [CODE CHANGES]
         """
 
-        raw_diff_log = self.repo.git.show(commit_id, pretty='format:', unified=999999999).splitlines()
-        unfiltered_diff_log = split_diff_log(raw_diff_log)
-        diff_log = [log for log in unfiltered_diff_log if log[0][:10] == "diff --git"]
+        with timing.stage("show"):
+            raw_diff = self.git.diff_commit(commit_id, self.pathspecs, self.unified)
+        timing.add("show", 0, len(raw_diff), calls=0)
+        return self.process_commit_log(commit_id, show_msg, raw_diff.splitlines(), logger, timing)
+
+    def process_streamed_commit(self, commit_id: str, logger: logger.Logger, timing: CommitStats = None) -> Dict:
+        "git show {commit_id} --pretty=format: --unified=999999999"
+        """
+        `process_one_commit` for the giant-commit lane and `--bytes_diff`: the diff is parsed
+        one file at a time while `git show` prints it, instead of being held as one string and
+        a list of lines first. Reading the diff is timed in the `parse` stage.
+        """
+        timing = timing or CommitStats(commit_id)
+        with timing.stage("header"):
+            show_msg = self.render_header(commit_id)
+
+        cmd = ["git", "-C", self.repo_path, *show_args(commit_id, self.pathspecs, self.unified)]
+        read = 0
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+            def raw_lines():
+                nonlocal read
+                for line in process.stdout:
+                    read += len(line)
+                    yield line
+
+            if self.bytes_diff:
+                raw_diff_log = self.decode_diff_log(commit_id, raw_lines(), logger)
+            else:
+                # Same lines as `splitlines` on the whole output
+                raw_diff_log = (part for line in raw_lines() for part in line.decode("utf-8", "surrogateescape").splitlines())
+            try:
+                extracted_commit = self.process_commit_log(commit_id, show_msg, raw_diff_log, logger, timing)
+            except BaseException:
+                # git would block on a full pipe
+                process.kill()
+                raise
+        if process.returncode != 0:
+            raise GitCommandError(cmd, process.returncode)
+        timing.add("show", 0, read)
+        return extracted_commit
+
+    def decode_diff_log(self, commit_id: str, raw_lines: Iterator[bytes], logger: logger.Logger) -> Iterator[str]:
+        """
+        Lines of a `git show` diff read as bytes, decoded one file at a time. Only the files of
+        the mined languages are decoded whole, their chunks with the `--decode_errors` policy;
+        the other files are cut to the header lines that name them, which is all that
+        `commit_log_steps` reads of them. With "strict", a file that is not UTF-8 is cut the
+        same way and counted in `undecodable_files`.
+
+        Lines are split on "\n" (or "\r\n") only, whereas `str.splitlines` also breaks a
+        diff line on form feeds and the other Unicode line boundaries.
+        """
+        def split_lines():
+            for line in raw_lines:
+                if line[-1:] == b"\n":
+                    line = line[:-1]
+                if line[-1:] == b"\r":
+                    line = line[:-1]
+                yield line
+
+        for file_log in iter_diff_log(split_lines(), b"diff --git"):
+            if file_log[0][:10] != b"diff --git":
+                continue
+            try:
+                file_name = parse_line(file_log[0].decode("utf-8", "surrogateescape"), "start_of_file")[1]["to_file"]
+                language = file_language(file_name)
+                wanted = language is not None and language.lower() in self.language_keys
+            except ParseError:
+                # Decoded whole, so that `commit_log_steps` reports the file as usual
+                file_name, wanted = None, True
+
+            if wanted:
+                try:
+                    yield from decode_file_log(file_log, self.decode_errors)
+                    continue
+                except UnicodeDecodeError as e:
+                    logger.warning(f"Skip {file_name} of {commit_id}, it is not {e.encoding}: {e.reason}")
+                    self.stats.count("undecodable_files")
+            yield from (line.decode("utf-8", "surrogateescape") for line in file_log[:diff_header_length(file_log)])
+
+    def render_header(self, commit_id: str) -> List[str]:
+        header = self.objects.commit_header(commit_id)
+        return f"{commit_id}\n{' '.join(header['parents'])}\n{header['author']}\n{header['date']}\n{header['subject']}\n{header['body']}\n[MODIFIED]".splitlines()
+
+    def process_commit_log(self, commit_id: str, show_msg: List[str], raw_diff_log: List[str], logger: logger.Logger,
+                           timing: CommitStats = None) -> Dict:
+        """
+        Mine a commit from its rendered header and diff, running its blames one after another.
+        """
+        timing = timing or CommitStats(commit_id)
+        steps = self.commit_log_steps(commit_id, show_msg, raw_diff_log, logger)
+        with timing.stage("parse"):
+            requests = next(steps)
+
+        outputs = []
+        for request in requests:
+            with timing.stage("blame"):
+                output = self.git.blame(*request)
+            timing.add("blame", 0, len(output), calls=0)
+            outputs.append(output.splitlines())
+        try:
+            with timing.stage("blame_parse"):
+                steps.send(outputs)
+        except StopIteration as stop:
+            return stop.value
+
+    def cached_blame(self, file_diff, file_name: str) -> Dict:
+        """
+        Whole-file blame of the pre-image of a file diff from the blame cache.
+        :returns Dict the `get_file_blame_incremental` structure, None on a miss or without `--blame_cache`
+        """
+        if self.blame_cache is None:
+            return None
+        blob = file_diff["from"].get("blob")
+        file_blame = self.blame_cache.get(blob, file_name) if blob else None
+        self.stats.count("blame_cache_hits" if file_blame is not None else "blame_cache_misses")
+        return file_blame
+
+    def store_blame(self, file_diff, file_name: str, file_blame: Dict) -> None:
+        """
+        Cache the whole-file blame of the pre-image of a file diff.
+        """
+        if self.blame_cache is None or not file_diff["from"].get("blob"):
+            return
+        self.blame_cache.put(file_diff["from"]["blob"], file_name, file_blame)
+
+    def commit_log_steps(self, commit_id: str, show_msg: List[str], raw_diff_log: List[str], logger: logger.Logger) -> Generator[List[Tuple], List[List[str]], Dict]:
+        """
+        Generator behind `process_commit_log`. It parses the diff, yields once the
+        (rev, file, line ranges) of the blames that the commit needs, receives their output
+        lines in the same order and returns the mined commit (None if no file matches).
+        """
+        files_index = show_msg.index('[MODIFIED]')
+        subject = show_msg[4]
+        head = show_msg[:5]
+        commit_msg = show_msg[5:files_index]
+
+        parent_id = head[1]
+        author = head[2]
+        commit_date = head[3]
+        commit_msg = " ".join(commit_msg)
+        # Lazy, so that a streamed diff is parsed one file at a time
+        diff_log = (log for log in iter_diff_log(raw_diff_log) if log[0][:10] == "diff --git")
         # logger.info(raw_diff_log)
         commit_diff = {}
         commit_blame = {}
         files = []
+        touched = set()
+        pre_images = {}
+        entries = []
         for log in diff_log:
+            hunks = None
             try:
-                files_diff = aggregator(parse_lines(log))
+                parsed_lines = parse_lines(log)
+                if self.blame_engine is not None or self.blame_ranges:
+                    # `split_diff_log` gives one file per log, keep its hunk positions for the replay and the blame ranges
+                    parsed_lines = list(parsed_lines)
+                    hunks = [
+                        (parsed["from_line_start"], parsed["from_line_count"], parsed["to_line_count"])
+                        for state, parsed, _ in parsed_lines if state == "chunk_header"
+                    ]
+                files_diff = slotted_aggregator(parsed_lines) if self.slotted else aggregator(parsed_lines)
             except:
                 logger.error(f"Exception {e} : {log}")
             for file_diff in files_diff:                
+                touched.update((file_diff["from"]["file"], file_diff["to"]["file"]))
                 file_name_a = (
                     file_diff["from"]["file"]
                     if file_diff["rename"] or file_diff["from"]["mode"] != "0000000"
@@ -155,35 +755,111 @@ class Miner:
                 if file_diff["from"]["mode"] == "0000000":
                     continue
                 
-                try:
-                    file_extension = file_name_b.rsplit(".")[1].lower()
-                except:
-                    file_extension = None
+                language = file_language(file_name_b)
+                if language is None or language.lower() not in self.language_keys:
+                    continue
 
-                file_language = EXT2LANG.get(file_extension, None)
-                if file_language is None or file_language.lower() != self.languages.lower():
+                if not self.blame:
+                    entries.append((file_diff, file_name_a, file_name_b, hunks, None, None, None, None))
                     continue
 
-                "git blame -t -n -l {parent_id} '{file_name_a}'"
+                "git blame --incremental {parent_id} '{file_name_a}'"
                 """
-                Example output:
-                746f1ff36ac0d232687820fbde4e4efc79093af7   1 (Rémi Denis-Courmont 1664203942 +0300   1) /*
-                746f1ff36ac0d232687820fbde4e4efc79093af7   2 (Rémi Denis-Courmont 1664203942 +0300   2)  * Copyright © 2022 Rémi Denis-Courmont.
-                746f1ff36ac0d232687820fbde4e4efc79093af7   3 (Rémi Denis-Courmont 1664203942 +0300   3)  * Loosely based on earlier work copyrighted by Måns Rullgård, 2008.
-                746f1ff36ac0d232687820fbde4e4efc79093af7   4 (Rémi Denis-Courmont 1664203942 +0300   4)  *
-                746f1ff36ac0d232687820fbde4e4efc79093af7   5 (Rémi Denis-Courmont 1664203942 +0300   5)  * This file is part of FFmpeg.
+                Example output, one group of consecutive lines per header, commit details only the first time:
+                746f1ff36ac0d232687820fbde4e4efc79093af7 1 1 5
+                author Rémi Denis-Courmont
+                author-mail <remi@remlab.net>
+                author-time 1664203942
+                author-tz +0300
+                ...
+                summary lavc/h264: add RISC-V Vector intrinsics
+                filename libavcodec/riscv/h264dsp_init.c
                 """
 
-                file_blame_log = self.repo.git.blame(parent_id, file_name_a, t=True, n=True, l=True).splitlines()
+                blame_lines = None
+                if self.blame_ranges:
+                    try:
+                        blame_lines = deleted_lines(file_diff["content"], hunks)
+                    except ValueError as e:
+                        logger.error(f"Blaming the whole file {file_name_a} of {commit_id}: {e}")
 
-                if not file_blame_log:
+                line_blame, cached_blame, request = None, None, None
+                if self.blame_engine is not None:
+                    line_blame = self.blame_engine.lookup(parent_id, file_name_a)
+                    if line_blame is None:
+                        cached_blame = self.cached_blame(file_diff, file_name_a)
+                        line_blame = expand_file_blame(cached_blame) if cached_blame is not None else None
+                    if line_blame is None:
+                        request = (parent_id, file_name_a, None)
+                elif blame_lines is not None:
+                    # Same files as a whole-file blame, which is empty for an empty pre-image
+                    if sum(from_count for _, from_count, _ in hunks) == 0:
+                        continue
+                    cached_blame = self.cached_blame(file_diff, file_name_a)
+                    line_blame = expand_file_blame(cached_blame) if cached_blame is not None else None
+                    if line_blame is None and blame_lines:
+                        request = (parent_id, file_name_a, line_ranges(blame_lines))
+                else:
+                    cached_blame = self.cached_blame(file_diff, file_name_a)
+                    if cached_blame is None:
+                        request = (parent_id, file_name_a, None)
+                entries.append((file_diff, file_name_a, file_name_b, hunks, blame_lines, line_blame, cached_blame, request))
+
+        # Every blame of the commit is requested at once, the caller decides how to run them
+        outputs = iter((yield [entry[-1] for entry in entries if entry[-1] is not None]))
+
+        for file_diff, file_name_a, file_name_b, hunks, blame_lines, line_blame, cached_blame, request in entries:
+            file_blame_log = next(outputs) if request is not None else None
+            if not self.blame:
+                # Same files as with the blame, which is empty for an empty pre-image
+                if self.context is None:
+                    from_lines = file_diff["meta_a"]["lines"]
+                else:
+                    from_lines = self.count_lines(f"{parent_id}:{file_name_a}")
+                if from_lines == 0:
                     continue
+                file_blame = None
+            elif self.blame_engine is not None:
+                if line_blame is None:
+                    line_blame = get_line_blame_incremental(file_blame_log)
+                    if self.blame_cache is not None:
+                        self.store_blame(file_diff, file_name_a, group_line_blame(line_blame))
+
+                if not line_blame:
+                    continue
+
+                file_blame = group_line_blame(line_blame, blame_lines)
+                pre_images[file_name_b] = (file_name_a, line_blame, hunks)
+                from_lines = len(line_blame)
+            elif blame_lines is not None:
+                if line_blame is not None:
+                    file_blame = group_line_blame(line_blame, blame_lines)
+                    from_lines = len(line_blame)
+                else:
+                    # A range blame is not cached, it does not cover the whole file
+                    file_blame = get_file_blame_incremental(file_blame_log) if request is not None else {}
+                    from_lines = self.count_lines(f"{parent_id}:{file_name_a}") if self.context is not None else None
+            else:
+                if cached_blame is not None:
+                    file_blame = cached_blame
+                else:
+                    file_blame = get_file_blame_incremental(file_blame_log) if file_blame_log else {}
+                    self.store_blame(file_diff, file_name_a, file_blame)
+                if not file_blame:
+                    continue
+
+                from_lines = sum(r["end"] - r["start"] + 1 for blame in file_blame.values() for r in blame["ranges"])
+
+            if self.context is not None:
+                # Bounded context: the hunks no longer span the file, the pre-image line count does
+                set_line_counts(file_diff, from_lines)
+            commit_blame[file_name_b] = file_blame
+            commit_diff[file_name_b] = file_diff
+            files.append(file_name_b)
+
+        if self.blame_engine is not None:
+            self.blame_engine.update(commit_id, parent_id, touched, pre_images, commit_diff)
 
-                file_blame = get_file_blame(file_blame_log)
-                commit_blame[file_name_b] = file_blame
-                commit_diff[file_name_b] = file_diff
-                files.append(file_name_b)
-            
         if len(files) == 0:
             return None
 
@@ -198,70 +874,691 @@ class Miner:
             "diff": commit_diff,
             "blame": commit_blame,
         }
+        if not self.blame:
+            # Attached later to the selected commits by `attach_blame`
+            del commit["blame"]
         return commit
     
-    def process_multiple_commits(self, commit_ids: List[str], worker_id: int = 0) -> List[Dict]:
-        extracted_commits_list = []
-        log_file = f"logs_miner_{self.repo_name}_{worker_id}.log"
-        logger = create_log_handler(log_file)
+    def stream_commit_logs(self, commit_ids: List[str]) -> Iterator[Tuple[str, List[str], List[str]]]:
+        "git log --no-walk=unsorted --stdin --raw -p --unified=999999999 --format=%x00{COMMIT_FORMAT}"
+        """
+        Mine a whole batch of commits with a single `git log` process instead of two
+        `git show` per commit. Each record is split into the same `show_msg` (header,
+        [MODIFIED], raw file list) and `raw_diff_log` lines that `process_one_commit`
+        builds, so both paths go through `process_commit_log`.
+        """
+        cmd = [
+            "git", "-C", self.repo_path, "log", "--no-walk=unsorted", "--stdin",
+            "--raw", "-p", f"--unified={self.unified}", f"--format=%x00{COMMIT_FORMAT}",
+            "--", *self.pathspecs,
+        ]
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        process.stdin.write("".join(f"{commit_id}\n" for commit_id in commit_ids).encode())
+        process.stdin.close()
+
+        commit_id, show_msg, raw_diff_log = None, [], []
+        in_diff = False
+        try:
+            for raw_line in process.stdout:
+                # Same decoding and line splitting as `repo.git.show(...).splitlines()`
+                line = raw_line.rstrip(b"\n").decode("utf-8", "surrogateescape")
+                if line[:1] == COMMIT_SEPARATOR:
+                    if commit_id is not None:
+                        yield commit_id, show_msg, raw_diff_log
+                    commit_id, show_msg, raw_diff_log = line[1:], [line[1:]], []
+                    in_diff = False
+                    continue
+                for part in line.splitlines() or [""]:
+                    if not in_diff and part[:10] == "diff --git" and "[MODIFIED]" in show_msg:
+                        in_diff = True
+                    if in_diff:
+                        raw_diff_log.append(part)
+                    else:
+                        show_msg.append(part)
+            if commit_id is not None:
+                yield commit_id, show_msg, raw_diff_log
+        finally:
+            process.stdout.close()
+            process.wait()
+
+    def next_shard_file(self, language: str) -> str:
+        """
+        Shard file of the current worker process in a language stream, rotated every
+        `num_commits_per_files` commits so that small batches of the work queue still produce large shards.
+        """
+        shard_file, shard_size = self.shard_files.get(language, (None, 0))
+        if shard_file is None or shard_size >= self.num_commits_per_files:
+            file_id = generate_id()
+            shard_file, shard_size = f"{self.streams[language][0]}/extracted-{self.repo_name}-{file_id}.jsonl", 0
+        self.shard_files[language] = (shard_file, shard_size + 1)
+        return shard_file
+
+    def split_languages(self, extracted_commit: Dict) -> Dict[str, Dict]:
+        """
+        Split a mined commit into one record per language stream, each with the files of its
+        language only. A language without files in the commit gets None.
+        """
+        if extracted_commit is None or len(self.streams) == 1:
+            return {language: extracted_commit for language in self.streams}
+
+        files = {language: [] for language in self.streams}
+        for file_name in extracted_commit["files"]:
+            files[self.language_keys[file_language(file_name).lower()]].append(file_name)
+        records = {}
+        for language, language_files in files.items():
+            if not language_files:
+                records[language] = None
+                continue
+            record = dict(extracted_commit, files=language_files, diff={file_name: extracted_commit["diff"][file_name] for file_name in language_files})
+            if "blame" in extracted_commit:
+                record["blame"] = {file_name: extracted_commit["blame"][file_name] for file_name in language_files}
+            records[language] = record
+        return records
+
+    def process_multiple_commits(self, commit_ids: List[str], worker_id: int = 0, giant: bool = False) -> Tuple[int, Dict[str, List[int]], MinerStats]:
+        """
+        Mine a batch of commits into the worker's shard files.
+        :param bool giant: the commits come from the giant-commit lane, their diffs are streamed
+        :returns (worker_id, {shard file: [first date, last date]}, stats) of the shards written by the batch
+        """
+        shards = {}
+        logger = self.worker_logger if self.worker_logger is not None else create_log_handler(f"logs_miner_{self.repo_name}_{worker_id}.log")
         # logger.info(commit_ids)
-        for commit_id in tqdm(commit_ids, f"Thread {worker_id}"):            
-            if len(extracted_commits_list) % self.num_commits_per_files == 0:
-                file_id = generate_id()
-                out_file = f"{self.save_path}/extracted-{self.repo_name}-{file_id}.jsonl"
-            
+        if self.blame_engine is not None:
+            self.blame_engine.prefetch(commit_ids)
+        if giant:
+            for commit_id in commit_ids:
+                timing = CommitStats(commit_id)
+                try:
+                    extracted_commit = self.process_streamed_commit(commit_id, logger, timing)
+                    self.save_commit(commit_id, extracted_commit, shards, timing)
+                    self.stats.count("giant_commits")
+                except Exception as e:
+                    logger.error(f"Exception {e} - Failed to mine {commit_id}")
+                    logger.error(traceback.format_exc())
+                    self.stats.count("commits_failed")
+                extracted_commit = None
+                gc.collect()
+            return worker_id, shards, self.take_stats()
+
+        if self.async_git > 0:
+            mined = asyncio.run(self.mine_commits_async(commit_ids, logger))
+            for commit_id, (extracted_commit, error, timing) in zip(commit_ids, mined):
+                if error is not None:
+                    logger.error(f"Exception {error} - Failed to mine {commit_id}")
+                    logger.error("".join(traceback.format_exception(type(error), error, error.__traceback__)))
+                    self.stats.count("commits_failed")
+                    continue
+                self.save_commit(commit_id, extracted_commit, shards, timing)
+            return worker_id, shards, self.take_stats()
+
+        if self.stream:
+            commit_logs = self.stream_commit_logs(commit_ids)
+        else:
+            commit_logs = ((commit_id, None, None) for commit_id in commit_ids)
+
+        streamed = set()
+        while True:
+            started = time.perf_counter()
+            commit_id, show_msg, raw_diff_log = next(commit_logs, (None, None, None))
+            if commit_id is None:
+                break
+            streamed.add(commit_id)
+            timing = CommitStats(commit_id)
             try: 
-                extracted_commit = self.process_one_commit(commit_id, logger)
-                if extracted_commit is not None:
-                    extracted_commits_list.append(extracted_commit)
-                    append_jsonl([extracted_commit], out_file)
+                if show_msg is None:
+                    extracted_commit = self.process_one_commit(commit_id, logger, timing)
+                else:
+                    # Reading the streamed `git log` record is the `show` stage of this mode
+                    timing.add("show", time.perf_counter() - started, sum(len(line) + 1 for line in raw_diff_log))
+                    extracted_commit = self.process_commit_log(commit_id, show_msg, raw_diff_log, logger, timing)
+                self.save_commit(commit_id, extracted_commit, shards, timing)
             except Exception as e:
                 logger.error(f"Exception {e} - Failed to mine {commit_id}")
                 logger.error(traceback.format_exc())
-        return worker_id, extracted_commits_list
+                self.stats.count("commits_failed")
+        if self.stream:
+            # `git log -- <pathspecs>` leaves out the commits without a file of the language, which are empty
+            for commit_id in commit_ids:
+                if commit_id not in streamed:
+                    self.save_commit(commit_id, None, shards, CommitStats(commit_id))
+        return worker_id, shards, self.take_stats()
+
+    def take_stats(self) -> MinerStats:
+        """
+        Hand the stats of the finished batch over to the parent process and start new ones.
+        """
+        self.stats.sample_rss()
+        stats, self.stats = self.stats, MinerStats(self.top_slowest)
+        return stats
+
+    def save_commit(self, commit_id: str, extracted_commit: Dict, shards: Dict[str, List[int]], timing: CommitStats) -> None:
+        """
+        Append a mined commit to the worker's shard, then record it in the manifest and in the stats.
+        """
+        with timing.stage("write"):
+            self.write_commit(commit_id, extracted_commit, shards)
+
+        if extracted_commit is not None:
+            diff_bytes = sum(
+                len(line) + 1
+                for file_diff in extracted_commit["diff"].values() for chunk in file_diff["content"]
+                for lines in (chunk.get("ab"), chunk.get("a"), chunk.get("b")) if lines for line in lines
+            )
+            timing.finish(len(extracted_commit["files"]), diff_bytes)
+            self.stats.count("commits_mined")
+        else:
+            timing.finish()
+            self.stats.count("commits_empty")
+        self.stats.count("blames", timing.stages.get("blame", {}).get("calls", 0))
+        self.stats.record(timing)
+        self.stats.sample_rss()
+
+    def write_commit(self, commit_id: str, extracted_commit: Dict, shards: Dict[str, List[int]]) -> None:
+        for language, language_commit in self.split_languages(extracted_commit).items():
+            out_file = None
+            if language_commit is not None:
+                out_file = self.next_shard_file(language)
+                append_jsonl([language_commit], out_file)
+                date = language_commit["date"]
+                date_range = shards.setdefault(out_file, [date, date])
+                date_range[0], date_range[1] = min(date_range[0], date), max(date_range[1], date)
+                if len(self.streams) > 1:
+                    self.stats.count(f"commits_mined_{language}")
+            # Written after the shard, so a recorded commit is always on disk
+            append_jsonl([{
+                "commit_id": commit_id,
+                "file": os.path.basename(out_file) if out_file is not None else None,
+                "date": language_commit["date"] if language_commit is not None else None,
+            }], self.streams[language][1])
+
+    async def run_git(self, args: List[str], semaphore: asyncio.Semaphore, timing: CommitStats) -> List[str]:
+        """
+        Run a git command as an asyncio subprocess, at most `--async_git` at a time per worker.
+        Its time is added to the stage named after the git command, once a slot is free.
+        :returns List[str] output lines, decoded like GitPython does
+        """
+        async with semaphore:
+            started = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                "git", "-C", self.repo_path, *args,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            )
+            stdout, stderr = await process.communicate()
+            timing.add(args[0], time.perf_counter() - started, len(stdout))
+        if process.returncode != 0:
+            raise GitCommandError(["git", *args], process.returncode, stderr)
+        return stdout.decode("utf-8", "surrogateescape").splitlines()
+
+    async def mine_commits_async(self, commit_ids: List[str], logger: logger.Logger) -> List[Tuple[Dict, Exception]]:
+        """
+        Keep several commits and their blames in flight at once. The `git show` of every commit
+        and the blames of a commit run concurrently, bounded by `--async_git`. With the
+        incremental blame, each commit waits for the previous one before planning its blames,
+        since the derived blames depend on the commits mined before.
+        :returns [(mined commit, None, stats) or (None, exception, stats)] in the order of `commit_ids`
+        """
+        semaphore = asyncio.Semaphore(self.async_git)
+        done = [asyncio.Event() for _ in commit_ids]
+
+        async def mine(index, commit_id):
+            timing = CommitStats(commit_id)
+            try:
+                with timing.stage("header"):
+                    show_msg = self.render_header(commit_id)
+                raw_diff_log = await self.run_git(show_args(commit_id, self.pathspecs, self.unified), semaphore, timing)
+                if self.blame_engine is not None and index > 0:
+                    await done[index - 1].wait()
+
+                steps = self.commit_log_steps(commit_id, show_msg, raw_diff_log, logger)
+                with timing.stage("parse"):
+                    requests = next(steps)
+                outputs = await asyncio.gather(*(self.run_git(blame_args(*request), semaphore, timing) for request in requests))
+                try:
+                    with timing.stage("blame_parse"):
+                        steps.send(list(outputs))
+                except StopIteration as stop:
+                    return stop.value, None, timing
+            except Exception as e:
+                return None, e, timing
+            finally:
+                done[index].set()
+
+        return await asyncio.gather(*(mine(index, commit_id) for index, commit_id in enumerate(commit_ids)))
+
+    def rev_list_args(self) -> List[str]:
+        """
+        Arguments of the `git rev-list` that enumerates the commits to mine, newest first.
+        """
+        args = [self.tip, *[f"^{commit_id}" for commit_id in self.exclude]]
+        if self.since is not None:
+            args.append(f"--since={self.since}")
+        if self.until is not None:
+            args.append(f"--until={self.until}")
+        if self.first_parent:
+            args.append("--first-parent")
+        if self.no_merges:
+            # Merges are filtered by `diff --git` anyway, git can skip them before any diff
+            args.append("--no-merges")
+        if self.pathspecs:
+            # --full-history keeps side-branch commits that default history simplification would prune
+            args.extend(["--full-history", "--", *self.pathspecs])
+        return args
+
+    def enumerate_commits(self) -> List[str]:
+        "git rev-list {tip} [options] [-- pathspecs]"
+        """
+        Stream the commit ids instead of building a GitPython `Commit` for each of them,
+        and stop reading once `--end` is reached.
+        """
+        start, end = self.start or 0, self.end
+        if start < 0 or (end is not None and end < 0):
+            # Counted from the oldest commit, the whole history has to be read first
+            start, end = 0, None
+
+        commits = []
+        enumerated = self.git.enumerate_commits(self.rev_list_args())
+        for index, commit_id in enumerate(enumerated):
+            if end is not None and index >= end:
+                enumerated.close()
+                break
+            if index >= start:
+                commits.append(commit_id)
+
+        if (start, end) != (self.start or 0, self.end):
+            commits = commits[self.start:self.end]
+        return commits
+
+    def write_commit_graph(self) -> None:
+        "git commit-graph write --reachable [--changed-paths]"
+        """
+        Write a commit-graph so that the traversals read commit parents and dates from one
+        file instead of parsing every commit object. With `--pathspec` it also stores the
+        changed-path Bloom filters used by path-limited traversals.
+        """
+        started = time.perf_counter()
+        write = ["git", "-C", self.repo_path, "commit-graph", "write", "--reachable"]
+        if self.pathspecs:
+            write.append("--changed-paths")
+        subprocess.run(write, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        self.logger.info(f"Wrote commit-graph in {time.perf_counter() - started:.2f}s")
+
+    def estimate_commits(self, commit_ids: List[str]) -> Dict[str, Tuple[int, int]]:
+        "git log --no-walk=unsorted --stdin --no-renames --raw --no-abbrev [--numstat] --format=%x00%H"
+        """
+        Per-commit estimates: the number of files in the commit's tree diff, which drives
+        the number of blames, and the size of its `git show`. A whole-file diff prints both
+        sides of every file, so its size comes from the sizes of the `--raw` blobs, read with
+        a single `git cat-file --batch-check`; only trees are compared. A bounded diff is
+        estimated from the `--numstat` line counts, which diffs the blobs of every commit.
+        :returns {commit_id: (files, diff bytes)}
+        """
+        numstat = self.context is not None
+        cmd = ["git", "-C", self.repo_path, "log", "--no-walk=unsorted", "--stdin", "--no-renames", "--raw", "--no-abbrev", *(["--numstat"] if numstat else []), "--format=%x00%H", "--", *self.pathspecs]
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        process.stdin.write("".join(f"{commit_id}\n" for commit_id in commit_ids).encode())
+        process.stdin.close()
+
+        files, changes = {}, {}
+        commit_id = None
+        for line in process.stdout:
+            if line[:1] == b"\x00":
+                commit_id = line[1:].strip().decode()
+                files[commit_id], changes[commit_id] = [], []
+            elif line[:1] == b":":
+                fields = line.split(b"\t", 1)[0].split()
+                files[commit_id].append((fields[2].decode(), fields[3].decode()))
+            elif line.strip():
+                # `--numstat` lists the files of `--raw` in the same order, `-` for binary files
+                changes[commit_id].append(tuple(line.split(b"\t", 2)[:2]))
+        process.wait()
+
+        if numstat:
+            return {
+                commit_id: (1 + len(blobs), sum((int(added) + int(deleted)) * (2 * self.context + 1) * AVERAGE_LINE_BYTES
+                                                for added, deleted in changes[commit_id] if added != b"-"))
+                for commit_id, blobs in files.items()
+            }
+        sizes = self.blob_sizes({blob for blobs in files.values() for pair in blobs for blob in pair if blob.strip("0")})
+        return {
+            commit_id: (1 + len(blobs), sum(sizes.get(blob, 0) for pair in blobs for blob in pair))
+            for commit_id, blobs in files.items()
+        }
+
+    def blob_sizes(self, blobs: Set[str]) -> Dict[str, int]:
+        "git cat-file --batch-check"
+        if not blobs:
+            return {}
+        output = subprocess.run(["git", "-C", self.repo_path, "cat-file", "--batch-check"], input="".join(f"{blob}\n" for blob in blobs).encode(),
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+        sizes = {}
+        for line in output.decode().splitlines():
+            # Gitlinks of submodules are reported `missing`
+            fields = line.split()
+            if len(fields) == 3 and fields[1] == "blob":
+                sizes[fields[0]] = int(fields[2])
+        return sizes
+
+    def make_batches(self, commit_ids: List[str], estimates: Dict[str, Tuple[int, int]]) -> List[List[str]]:
+        """
+        Cut the commits into small contiguous batches for the work queue. With several
+        workers the most expensive batches are queued first so that no slow batch is
+        left alone at the tail of the run. Batches keep the commit order, which is what
+        the streaming and incremental blame modes rely on.
+        """
+        batches = [commit_ids[i:i + self.batch_size] for i in range(0, len(commit_ids), self.batch_size)]
+        if self.workers > 1 and len(batches) > 1:
+            batches.sort(key=lambda batch: sum(estimates.get(commit_id, (1, 0))[0] for commit_id in batch), reverse=True)
+        return batches
 
     def process_parallel(self):
-        self.commits = [commit.hexsha for commit in self.repo.iter_commits()]
-        if self.start is not None and self.end is not None:
-            self.commits = self.commits[self.start:self.end]
-        elif self.start is not None:
-            self.commits = self.commits[self.start:]
-        elif self.end is not None:
-            self.commits = self.commits[:self.end]
+        # Pin the tip so that every shard enumerates the same ordered commit list
+        if self.tip is None:
+            self.tip = self.repo.commit(self.rev).hexsha
+        if self.commit_graph:
+            self.write_commit_graph()
+        started = time.perf_counter()
+        self.commits = self.enumerate_commits()
+        self.logger.info(f"Enumerated {len(self.commits)} commits in {time.perf_counter() - started:.2f}s")
         self.commits.reverse()        
         # self.logger.info(self.commits)
-        num_commits = len(self.commits)
-        sublists = split_list(self.commits, self.workers)
-        num_thread = self.workers
+        self.total_commits = len(self.commits)
+        self.shard_start, self.shard_end = 0, self.total_commits
+        if self.shard is not None:
+            self.shard_start, self.shard_end = shard_bounds(self.total_commits, *self.shard)
+            self.commits = self.commits[self.shard_start:self.shard_end]
+        # A commit is mined again for every stream if one of their manifests misses it
+        manifests = [self.load_manifest(language) for language in self.streams]
+        pending = [commit_id for commit_id in self.commits if not all(commit_id in manifest for manifest in manifests)]
+        self.logger.info(f"Skip {len(self.commits) - len(pending)} commits already mined")
+        # The estimates order the batches of several workers and feed the memory budget, the giant-commit lane only applies then
+        estimates = {}
+        if self.workers > 1 or self.memory_budget is not None:
+            estimates = self.estimate_commits(pending)
+        giant_bytes = self.giant_commit_size << 20
+        giants = [commit_id for commit_id in pending if giant_bytes > 0 and estimates.get(commit_id, (1, 0))[1] > giant_bytes]
+        if giants:
+            giant_set = set(giants)
+            pending_regular = [commit_id for commit_id in pending if commit_id not in giant_set]
+            self.logger.info(f"Route {len(giants)} giant commits (up to {max(estimates[commit_id][1] for commit_id in giants) >> 20} MiB of diff) to the giant-commit lane")
+        else:
+            pending_regular = pending
+        batches = self.make_batches(pending_regular, estimates)
         
-        futures = []
-        results = []
-        self.logger.info("Start processing")
-        with ProcessPoolExecutor(max_workers=num_thread) as executor:
-            for thread_id in range(num_thread):
-                self.logger.info(f"Initiate thread {thread_id}")
-                futures.append(executor.submit( self.process_multiple_commits, sublists[thread_id], thread_id))
-
-            for future in as_completed(futures):
-                result = future.result()
-                self.logger.info(f"Thread {result[0]} completed!")
-                results.append(result[1])
-
-        final_results = list(heapq.merge(*results, key=lambda x: x["date"]))
-        return final_results
+        self.logger.info(f"Start processing {len(pending)} commits in {len(batches)} batches")
+        shards = {}
+        tasks = deque((batch, False) for batch in batches)
+        giant_tasks = deque(([commit_id], True) for commit_id in giants)
+        budget = self.memory_budget << 20 if self.memory_budget is not None else None
+        worker_rss = {}
+        in_flight = {}
+        reserved = 0
+        worker_counter = multiprocessing.Value("i", 0)
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(self, worker_counter)) as executor:
+            with tqdm(total=len(pending), desc="Mining") as bar:
+                while tasks or giant_tasks or in_flight:
+                    # Keep one task queued per pool, giants first, as long as the memory they are expected to take fits the budget
+                    while len(in_flight) <= self.workers:
+                        running_giants = sum(giant for _, giant, _ in in_flight.values())
+                        queue = giant_tasks if giant_tasks and running_giants < self.giant_workers else tasks
+                        if not queue:
+                            break
+                        batch, giant = queue[0]
+                        memory = max(worker_rss.values(), default=0) + MEMORY_FACTOR * max(estimates.get(commit_id, (1, 0))[1] for commit_id in batch)
+                        if budget is not None and in_flight and reserved + memory > budget * self.workers:
+                            # Wait for running tasks to release memory; a task over the whole budget runs alone
+                            self.stats.count("throttled_dispatches")
+                            break
+                        queue.popleft()
+                        in_flight[executor.submit(mine_batch, batch, giant)] = (len(batch), giant, memory)
+                        reserved += memory
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        count, giant, memory = in_flight.pop(future)
+                        reserved -= memory
+                        worker_id, batch_shards, batch_stats = future.result()
+                        worker_rss[worker_id] = batch_stats.rss
+                        self.stats.merge(batch_stats)
+                        for shard_file, (first, last) in batch_shards.items():
+                            date_range = shards.setdefault(shard_file, [first, last])
+                            date_range[0], date_range[1] = min(date_range[0], first), max(date_range[1], last)
+                        bar.update(count)
+        return shards
+
+    def attach_blame(self, selection: Set[str]) -> Dict[str, int]:
+        """
+        Deferred blame stage of outputs mined with `--no_blame`: blame the selected commits that
+        the outputs hold without a blame, e.g. the VFCs of the label files, and attach the blames
+        to their records by commit id. Only these commits are shown and blamed again, through
+        the same code as a mining run with the blame, so their records end up the same.
+        Blames go to a `blame-*.jsonl` sidecar as they come, so an interrupted stage resumes.
+        :returns {language: number of records given a blame}
+        """
+        self.blame = True
+        if self.incremental_blame and self.blame_engine is None:
+            self.blame_engine = IncrementalBlame(self.repo_path)
+        started = time.perf_counter()
+
+        out_files = {language: self.output_file(language) for language in self.streams}
+        pending = {}
+        for out_file in out_files.values():
+            if not os.path.exists(out_file):
+                self.logger.error(f"Missing output {out_file}, mine it first")
+                continue
+            for date, commit_id in self.unblamed_commits(out_file, selection):
+                pending[commit_id] = date
+        # In date order, for the incremental blame
+        pending = sorted(pending, key=lambda commit_id: (pending[commit_id], commit_id))
+
+        blame_file = f"{self.save_path}/blame-{self.output_name()}.jsonl"
+        blames = {}
+        if os.path.exists(blame_file):
+            with open(blame_file, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn last line of an interrupted stage, the commit is blamed again
+                        continue
+                    blames[record["commit_id"]] = record["blame"]
+        commit_ids = [commit_id for commit_id in pending if commit_id not in blames]
+        self.logger.info(f"Blame {len(commit_ids)} of the {len(pending)} selected commits without a blame, {len(pending) - len(commit_ids)} are in {blame_file}")
+
+        batches = [commit_ids[i:i + self.batch_size] for i in range(0, len(commit_ids), self.batch_size)]
+        worker_counter = multiprocessing.Value("i", 0)
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(self, worker_counter)) as executor:
+            futures = [executor.submit(blame_batch, batch) for batch in batches]
+            with tqdm(total=len(commit_ids), desc="Blaming") as bar:
+                for future in as_completed(futures):
+                    _, batch_blames, batch_stats = future.result()
+                    self.stats.merge(batch_stats)
+                    append_jsonl([{"commit_id": commit_id, "blame": blame} for commit_id, blame in batch_blames.items()], blame_file)
+                    blames.update(batch_blames)
+                    bar.update(batch_stats.commits)
+
+        attached = {language: self.write_blames(out_file, blames) for language, out_file in out_files.items() if os.path.exists(out_file)}
+        self.logger.info(f"Attached blames: {attached}")
+        save_json(self.stats.summary(
+            repo=self.repo_name, blame_file=os.path.basename(blame_file), selected=len(selection), attached=attached,
+            workers=self.workers, wall_seconds=round(time.perf_counter() - started, 6),
+        ), f"{self.save_path}/summary-blame-{self.output_name()}.json")
+        return attached
+
+    @staticmethod
+    def unblamed_commits(out_file: str, selection: Set[str]) -> List[Tuple[int, str]]:
+        """
+        (date, commit_id) of the selected commits that an output holds without a blame.
+        JSONL records of other commits are skipped on their commit id prefix, without decoding them.
+        """
+        found = []
+        if is_record_file(out_file):
+            with RecordReader(out_file) as reader:
+                for commit_id in selection:
+                    record = reader.get(commit_id) if commit_id in reader else None
+                    if record is not None and "blame" not in record:
+                        found.append((record["date"], commit_id))
+            return found
+
+        with open_file(out_file, "rb") as f:
+            for line in f:
+                if line[:15] == b'{"commit_id": "' and line[55:56] == b'"' and line[15:55].decode() not in selection:
+                    continue
+                record = json.loads(line)
+                if record["commit_id"] in selection and "blame" not in record:
+                    found.append((record["date"], record["commit_id"]))
+        return found
+
+    @staticmethod
+    def write_blames(out_file: str, blames: Dict[str, Dict]) -> int:
+        """
+        Rewrite an output with the blames of `blames` added to its records that have none.
+        The other JSONL records are copied as they are.
+        :returns int number of records given a blame
+        """
+        count = 0
+        tmp_file = f"{os.path.dirname(out_file)}/blame-{generate_id()}-{os.path.basename(out_file)}"
+
+        def with_blame(record):
+            nonlocal count
+            if "blame" in record or record["commit_id"] not in blames:
+                return None
+            count += 1
+            commit_blame = blames[record["commit_id"]]
+            record["blame"] = {file_name: commit_blame.get(file_name, {}) for file_name in record["files"]}
+            return record
+
+        if is_record_file(out_file):
+            save_jsonl((with_blame(record) or record for record in load_jsonl(out_file)), tmp_file)
+            os.replace(tmp_file, out_file)
+            os.replace(index_path(tmp_file), index_path(out_file))
+            return count
+
+        with open_file(out_file, "rb") as src, open_file(tmp_file, "wb") as dst:
+            for line in src:
+                if line[:15] != b'{"commit_id": "' or line[15:55].decode() in blames:
+                    record = with_blame(json.loads(line))
+                    if record is not None:
+                        line = (json.dumps(record) + "\n").encode()
+                dst.write(line)
+        os.replace(tmp_file, out_file)
+        return count
+
+    def blame_commits(self, commit_ids: List[str], worker_id: int = 0) -> Tuple[int, Dict[str, Dict], MinerStats]:
+        """
+        Mine a batch of commits of the blame stage without writing them.
+        :returns (worker_id, {commit_id: {file: blame}}, stats)
+        """
+        logger = self.worker_logger if self.worker_logger is not None else create_log_handler(f"logs_miner_{self.repo_name}_{worker_id}.log")
+        if self.blame_engine is not None:
+            self.blame_engine.prefetch(commit_ids)
+        if self.async_git > 0:
+            mined = asyncio.run(self.mine_commits_async(commit_ids, logger))
+        else:
+            mined = []
+            for commit_id in commit_ids:
+                timing = CommitStats(commit_id)
+                try:
+                    mined.append((self.process_one_commit(commit_id, logger, timing), None, timing))
+                except Exception as e:
+                    mined.append((None, e, timing))
+
+        blames = {}
+        for commit_id, (extracted_commit, error, timing) in zip(commit_ids, mined):
+            timing.finish()
+            self.stats.record(timing)
+            self.stats.count("blames", timing.stages.get("blame", {}).get("calls", 0))
+            if error is not None:
+                logger.error(f"Exception {error} - Failed to blame {commit_id}")
+                logger.error("".join(traceback.format_exception(type(error), error, error.__traceback__)))
+                self.stats.count("commits_failed")
+                continue
+            blames[commit_id] = extracted_commit["blame"] if extracted_commit is not None else {}
+        return worker_id, blames, self.take_stats()
+
+    def __getstate__(self) -> Dict:
+        # The GitPython repository is re-opened by every worker in `init_worker`
+        state = self.__dict__.copy()
+        state["repo"] = None
+        return state
+
+_worker_miner = None
+
+def init_worker(miner: Miner, worker_counter) -> None:
+    """
+    Process pool initializer: the Miner is unpickled once per worker process, not once per task.
+    """
+    global _worker_miner
+    with worker_counter.get_lock():
+        worker_id = worker_counter.value
+        worker_counter.value += 1
+    miner.repo = Repo(miner.repo_path)
+    miner.worker_id = worker_id
+    miner.worker_logger = create_log_handler(f"logs_miner_{miner.repo_name}_{worker_id}.log")
+    _worker_miner = miner
+
+def mine_batch(commit_ids: List[str], giant: bool = False) -> Tuple[int, Dict[str, List[int]], MinerStats]:
+    return _worker_miner.process_multiple_commits(commit_ids, _worker_miner.worker_id, giant)
+
+def blame_batch(commit_ids: List[str]) -> Tuple[int, Dict[str, Dict], MinerStats]:
+    return _worker_miner.blame_commits(commit_ids, _worker_miner.worker_id)
 
 # Example usage
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(add_help= False)
     parser.add_argument("--workers", type= int, default= 1, help="Number of parallel workers")
-    parser.add_argument("--language", type= str, help="Language")
+    parser.add_argument("--language", type= str, help="Language, or comma-separated languages mined in one pass into per-language outputs")
     parser.add_argument("--url", type=str, help= "Git clone url")
-    parser.add_argument("--input_path", type=str, help= "Parent directory of input repository", default= DEFAULT_INPUT)
-    parser.add_argument("--output_path", type=str, help= "Output directory", default= DEFAULT_OUTPUT)
+    parser.add_argument("--path", type=str, help= "Parent directory of input repository", default= DEFAULT_INPUT)
+    parser.add_argument("--output_path", type=str, help= "Output directory", default= DEFAULT_EXTRACTED_OUTPUT)
     parser.add_argument("--start", type=int, default=None, help= "First commit index")
     parser.add_argument("--end", type=int, default=None, help="Last commit index")
+    parser.add_argument("--rev", type=str, default=None, help="Revision to enumerate commits from (default HEAD)")
+    parser.add_argument("--follow", action="store_true", help="Keep the mined tip and only mine and append the commits added since the last run")
+    parser.add_argument("--fetch", action="store_true", help="Fetch origin before resolving --rev, e.g. origin/master with --follow")
+    parser.add_argument("--shard", type=str, default=None, help="Mine only shard i/N (0-based) of the ordered commits")
+    parser.add_argument("--merge", type=str, nargs="+", default=None, help="Validate and merge these shard manifests, then exit")
+    parser.add_argument("--merge_output", type=str, default=None, help="Output file of --merge")
+    parser.add_argument("--since", type=str, default=None, help="Only mine commits more recent than this date")
+    parser.add_argument("--until", type=str, default=None, help="Only mine commits older than this date")
+    parser.add_argument("--first_parent", action="store_true", help="Follow only the first parent of merge commits")
+    parser.add_argument("--no_merges", action="store_true", help="Skip merge commits while enumerating")
+    parser.add_argument("--commit_graph", action="store_true", help="Write a commit-graph before enumerating the commits")
+    parser.add_argument("--records", action="store_true", help="Write the output as indexed binary records instead of JSONL")
+    parser.add_argument("--compression", type=str, default=None, choices=list(COMPRESSION_EXTENSIONS), help="Compress the JSONL output")
+    parser.add_argument("--slotted", action="store_true", help="Build file diffs as slotted objects, serialized when written")
+    parser.add_argument("--async_git", type=int, default=0, help="Git processes kept in flight by each worker with asyncio (0 runs them one by one); the outputs of a whole batch are held in memory. Not with --git_backend, --stream or --bytes_diff")
+    parser.add_argument("--top_slowest", type=int, default=20, help="Number of slowest commits in the run summary")
+    parser.add_argument("--context", type=int, default=None, help="Lines of diff context to store instead of whole files")
+    parser.add_argument("--pathspec", action="store_true", help="Let git restrict commits and diffs to the files of the --language languages")
+    parser.add_argument("--batch_size", type=int, default=64, help="Number of commits per task of the work queue")
+    parser.add_argument("--giant_commit_size", type=int, default=256, help="Estimated diff size in MiB above which a commit goes to the giant-commit lane, 0 to disable; only with several workers or a memory budget")
+    parser.add_argument("--giant_workers", type=int, default=1, help="Number of giant commits mined at once")
+    parser.add_argument("--memory_budget", type=int, default=None, help="Resident memory budget per worker in MiB, which throttles the dispatch of tasks")
+    parser.add_argument("--git_backend", type=str, default="gitpython", choices=list(GIT_BACKENDS),
+                        help="Repository access of the commit diffs, blames, blobs and enumeration")
+    parser.add_argument("--stream", action="store_true", help="Mine each worker's commits with one streamed `git log -p`")
+    parser.add_argument("--bytes_diff", action="store_true", help="Read each `git show` as bytes and decode only the files of --language")
+    parser.add_argument("--decode_errors", type=str, default="surrogateescape", choices=["surrogateescape", "replace", "backslashreplace", "ignore", "strict"],
+                        help="Decoding of the non-UTF-8 diff lines of --bytes_diff, `strict` skips the file")
+    parser.add_argument("--no_blame", action="store_true", help="Mine the diffs without the blame, which --attach_blame adds later")
+    parser.add_argument("--attach_blame", type=str, nargs="+", default=None,
+                        help="Label files or commit id lists: blame their commits in the outputs mined with --no_blame, then exit")
+    parser.add_argument("--incremental_blame", action="store_true", help="Derive blames from earlier blames plus the mined diffs")
+    parser.add_argument("--blame_ranges", action="store_true", help="Store the blame of the deleted and modified lines only")
+    parser.add_argument("--blame_cache", type=str, default=None, help="Directory of the blame cache shared by the runs, no cache by default")
+    parser.add_argument("--blame_cache_size", type=int, default=1024, help="Size of the blame cache in MiB")
 
     params = parser.parse_args()
-    miner = Miner(params)
-    miner.run()
+    if params.merge:
+        merge_output = params.merge_output or f"{os.path.dirname(os.path.abspath(params.merge[0]))}/extracted-all-merged{RECORD_EXTENSION if params.records else '.jsonl'}"
+        if params.compression and not params.records and params.merge_output is None:
+            merge_output += COMPRESSION_EXTENSIONS[params.compression]
+        merge_shard_outputs(params.merge, merge_output)
+    elif params.attach_blame:
+        miner = Miner(params)
+        miner.attach_blame(read_commit_ids(params.attach_blame))
+    else:
+        miner = Miner(params)
+        miner.run()
@@ -4,7 +4,7 @@ import traceback
 import numpy as np
 from typing import Dict, List, Tuple, Set
 from tqdm import tqdm
-from utils.utils import save_json, load_json, append_jsonl, load_jsonl, create_console_log_handler
+from utils.utils import JsonlWriter, save_json, load_json, load_jsonl, create_console_log_handler
 
 keywords_62 = [
     "do", "if", "asm", "for", "int", "new", "try", "auto", "bool", "case", "char", "else", "enum", "free", "goto", "long", 
@@ -63,24 +63,23 @@ class VCCFinder:
     
     def release (self, file: str):  
         number_unique_contributors = self.keep_track_meta["total_contributors"]    
-        if os.path.exists(file):
-            shutil.rmtree(file)
         feat = {}
-        for commit_id in tqdm(self.keep_track_meta["commits"]):
-            author = self.keep_track_meta["commits"][commit_id]["author"]
-            files = self.keep_track_meta["commits"][commit_id]["files"]
+        with JsonlWriter(file, append=False) as writer:
+            for commit_id in tqdm(self.keep_track_meta["commits"]):
+                author = self.keep_track_meta["commits"][commit_id]["author"]
+                files = self.keep_track_meta["commits"][commit_id]["files"]
             
-            past_changes, future_changes, past_different_authors, future_different_authors = self.get_changes(commit_id, author, files)
-            author_contributions_percent = self.get_author_contributions_percent(author)      
+                past_changes, future_changes, past_different_authors, future_different_authors = self.get_changes(commit_id, author, files)
+                author_contributions_percent = self.get_author_contributions_percent(author)      
             
-            feat["commit_id"] = commit_id
-            feat.update(self.keep_track_meta["commits"][commit_id])
-            feat["author_contributions_percent"] = author_contributions_percent
-            feat["past_changes"] = past_changes
-            feat["future_changes"] = future_changes
-            feat["past_different_authors"] = past_different_authors
-            feat["future_different_authors"] = future_different_authors
-            append_jsonl([feat], file)
+                feat["commit_id"] = commit_id
+                feat.update(self.keep_track_meta["commits"][commit_id])
+                feat["author_contributions_percent"] = author_contributions_percent
+                feat["past_changes"] = past_changes
+                feat["future_changes"] = future_changes
+                feat["past_different_authors"] = past_different_authors
+                feat["future_different_authors"] = future_different_authors
+                writer.write(feat)
                         
     def code_metrics (self, diff: Dict) -> Tuple[int, int, int]:
         addition, deletion, hunk_count = 0, 0, 0
@@ -52,6 +52,7 @@ def create_log_handler(worker_id: int):
 
 def main(input_json: str, out_json: str, conf: Dict, repos_dir: str, worker_id: int = 0):
     logger = create_log_handler(worker_id)  # Initialize logging for each core
+    Options.GIT_BACKEND = conf.get('git_backend', Options.GIT_BACKEND)
     
     bugfix_commits = []
     with open(input_json, 'r') as in_file:
@@ -6,4 +6,7 @@ class Options:
 
     TEMP_WORKING_DIR = '_szztemp'
     SZZ_LOG_DIR = '_szzlog'
-    SZZ_OUTPUT = '_szzout'
\ No newline at end of file
+    SZZ_OUTPUT = '_szzout'
+
+    # Git backend of the blames: gitpython, subprocess or pygit2 (set by `git_backend` in the conf file)
+    GIT_BACKEND = 'gitpython'
\ No newline at end of file
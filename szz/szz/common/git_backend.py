@@ -0,0 +1,422 @@
+import fnmatch
+import os
+import subprocess
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .object_reader import ObjectReader
+
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
+# (commit id, boundary, original path, original start line, final start line, line count, author, author time)
+BlameGroup = Tuple[str, bool, str, int, int, int, str, int]
+
+
+class GitBackendError(Exception):
+    pass
+
+
+def show_args(commit_id: str, pathspecs: Sequence[str] = (), unified: int = 3) -> List[str]:
+    return ["show", "--pretty=format:", f"--unified={unified}", commit_id, "--", *pathspecs]
+
+def blame_args(rev: str, file_path: str, line_ranges: Optional[Sequence[str]] = None, options: Sequence[str] = ()) -> List[str]:
+    return ["blame", "--incremental", *options, *[arg for lines in line_ranges or () for arg in ("-L", lines)], rev, "--", file_path]
+
+def parse_blame_groups(blame_log: Iterable[str]) -> List[BlameGroup]:
+    "git blame --incremental {rev} -- {file}"
+    """
+    Line groups of `git blame --incremental` output lines, in output order. The headers of
+    a commit are only printed, and parsed, the first time it appears.
+    """
+    groups = []
+    commits = {}
+    header = None
+    for line in blame_log:
+        if header is None:
+            sha, orig_start, final_start, count = line.split(" ")
+            header = (sha, int(orig_start), int(final_start), int(count))
+            info = commits.setdefault(sha, {})
+            continue
+
+        key, _, value = line.partition(" ")
+        if key == "filename":
+            sha, orig_start, final_start, count = header
+            groups.append((sha, "boundary" in info, value, orig_start, final_start, count, info.get("author", ""), int(info.get("author-time", 0))))
+            header = None
+        elif key in ("author", "author-time", "boundary"):
+            info[key] = value
+    return groups
+
+
+class GitBackend(ABC):
+    """
+    Repository access used by the Miner and the SZZ core: enumerate commits, read a blob,
+    diff a commit and blame line ranges. Every backend returns what the git command line
+    prints, so that the same parsers read the output of all of them.
+
+    Backends open their repository lazily in the process that uses them, so they can be
+    pickled into a process pool.
+    """
+    name = None
+
+    def __init__(self, repo_path: str):
+        """
+        :param str repo_path: path of the git repository
+        """
+        self.repo_path = repo_path
+
+    @abstractmethod
+    def enumerate_commits(self, rev_list_args: Sequence[str]) -> Iterator[str]:
+        """
+        Commit ids printed by `git rev-list {rev_list_args}`, read lazily so that the caller can stop early.
+        """
+
+    @abstractmethod
+    def read_blob(self, rev: str) -> bytes:
+        """
+        :param str rev: object name such as `sha:path`
+        :returns bytes raw content of the object
+        """
+
+    @abstractmethod
+    def diff_commit(self, commit_id: str, pathspecs: Sequence[str] = (), unified: int = 3) -> str:
+        """
+        Output of `git show --pretty=format: --unified={unified} {commit_id} -- {pathspecs}`.
+        """
+
+    @abstractmethod
+    def blame(self, rev: str, file_path: str, line_ranges: Optional[Sequence[str]] = None, options: Sequence[str] = ()) -> str:
+        """
+        Output of `git blame --incremental {options} -L {line_ranges} {rev} -- {file_path}`.
+
+        :param List[str] line_ranges: `start,end` ranges, the whole file if empty
+        :param List[str] options: other `git blame` flags such as `-w`, `-M` or `-C`
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class GitPythonBackend(GitBackend):
+    """
+    Every call goes through `Repo.git`, as the Miner and the SZZ core always did.
+    """
+    name = "gitpython"
+
+    def __init__(self, repo_path: str):
+        super().__init__(repo_path)
+        self._repo = None
+        self._pid = None
+
+    def __getstate__(self) -> Dict:
+        state = self.__dict__.copy()
+        state["_repo"] = None
+        state["_pid"] = None
+        return state
+
+    @property
+    def repo(self):
+        if self._pid != os.getpid():
+            from git import Repo
+            self._repo = Repo(self.repo_path)
+            self._pid = os.getpid()
+        return self._repo
+
+    def enumerate_commits(self, rev_list_args: Sequence[str]) -> Iterator[str]:
+        process = self.repo.git.rev_list(*rev_list_args, as_process=True)
+        try:
+            for line in process.stdout:
+                yield line.decode().strip()
+            process.wait()
+        finally:
+            if process.proc.poll() is None:
+                process.proc.kill()
+
+    def read_blob(self, rev: str) -> bytes:
+        return self.repo.rev_parse(rev).data_stream.read()
+
+    def diff_commit(self, commit_id: str, pathspecs: Sequence[str] = (), unified: int = 3) -> str:
+        return self.repo.git.show(commit_id, "--", *pathspecs, pretty="format:", unified=unified)
+
+    def blame(self, rev: str, file_path: str, line_ranges: Optional[Sequence[str]] = None, options: Sequence[str] = ()) -> str:
+        return self.repo.git.blame(*blame_args(rev, file_path, line_ranges, options)[1:])
+
+    def close(self) -> None:
+        if self._repo is not None and self._pid == os.getpid():
+            self._repo.close()
+        self._repo = None
+
+
+class SubprocessBackend(GitBackend):
+    """
+    Runs git directly, without GitPython's command wrapping. Commits are streamed from
+    `git rev-list` and blobs are read through the persistent `git cat-file` of ObjectReader.
+    """
+    name = "subprocess"
+
+    def __init__(self, repo_path: str):
+        super().__init__(repo_path)
+        self.objects = ObjectReader(repo_path)
+
+    def run(self, args: List[str]) -> str:
+        process = subprocess.run(["git", "-C", self.repo_path, *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, ["git", *args], stderr=process.stderr)
+        output = process.stdout.decode("utf-8", "surrogateescape")
+        # Same output as GitPython, which drops the last newline
+        return output[:-1] if output.endswith("\n") else output
+
+    def enumerate_commits(self, rev_list_args: Sequence[str]) -> Iterator[str]:
+        cmd = ["git", "-C", self.repo_path, "rev-list", *rev_list_args]
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+            try:
+                for line in process.stdout:
+                    yield line.decode().strip()
+            finally:
+                if process.poll() is None:
+                    process.kill()
+            if process.wait() != 0:
+                raise subprocess.CalledProcessError(process.returncode, cmd)
+
+    def read_blob(self, rev: str) -> bytes:
+        return self.objects.read(rev)[1]
+
+    def diff_commit(self, commit_id: str, pathspecs: Sequence[str] = (), unified: int = 3) -> str:
+        return self.run(show_args(commit_id, pathspecs, unified))
+
+    def blame(self, rev: str, file_path: str, line_ranges: Optional[Sequence[str]] = None, options: Sequence[str] = ()) -> str:
+        return self.run(blame_args(rev, file_path, line_ranges, options))
+
+    def close(self) -> None:
+        self.objects.close()
+
+
+class Pygit2Backend(GitBackend):
+    """
+    In-process libgit2 through pygit2, without any git process. What libgit2 cannot do like
+    git goes to the subprocess backend: rev-list options other than `--first-parent` and
+    `--no-merges`, pathspecs with magic other than `:(icase)` and blame options other than
+    `-w`, `-M` and `-C`.
+
+    Known differences with git: merge commits have no diff, where `git show` prints a
+    combined diff that the Miner skips; blob ids in `index` lines are abbreviated to
+    7 digits and rename similarity scores may be rounded differently; libgit2 blame has
+    no indent heuristic, so among equal lines it may credit other commits than git.
+    Run the benchmark of this module to check a repository.
+    """
+    name = "pygit2"
+
+    def __init__(self, repo_path: str):
+        if pygit2 is None:
+            raise GitBackendError("pygit2 is required by the pygit2 git backend")
+        super().__init__(repo_path)
+        self.fallback = SubprocessBackend(repo_path)
+        self._repo = None
+        self._mailmap = None
+        self._pid = None
+        self._authors = {}
+
+    def __getstate__(self) -> Dict:
+        state = self.__dict__.copy()
+        state["_repo"] = None
+        state["_mailmap"] = None
+        state["_pid"] = None
+        state["_authors"] = {}
+        return state
+
+    @property
+    def repo(self):
+        if self._pid != os.getpid():
+            self._repo = pygit2.Repository(self.repo_path)
+            self._mailmap = pygit2.Mailmap.from_repository(self._repo)
+            self._authors = {}
+            self._pid = os.getpid()
+        return self._repo
+
+    def enumerate_commits(self, rev_list_args: Sequence[str]) -> Iterator[str]:
+        revs = [arg for arg in rev_list_args if not arg.startswith("-")]
+        flags = [arg for arg in rev_list_args if arg.startswith("-")]
+        if len(revs) != 1 or any(flag not in ("--first-parent", "--no-merges") for flag in flags):
+            yield from self.fallback.enumerate_commits(rev_list_args)
+            return
+
+        # The default order of libgit2 is the one of `git rev-list`
+        walker = self.repo.walk(self.repo.revparse_single(revs[0]).id)
+        if "--first-parent" in flags:
+            walker.simplify_first_parent()
+        for commit in walker:
+            if "--no-merges" in flags and len(commit.parent_ids) > 1:
+                continue
+            yield str(commit.id)
+
+    def read_blob(self, rev: str) -> bytes:
+        return self.repo.revparse_single(rev).read_raw()
+
+    def diff_commit(self, commit_id: str, pathspecs: Sequence[str] = (), unified: int = 3) -> str:
+        patterns = []
+        for pathspec in pathspecs:
+            if not pathspec.startswith(":(icase)"):
+                return self.fallback.diff_commit(commit_id, pathspecs, unified)
+            patterns.append(pathspec[len(":(icase)"):].lower())
+
+        commit = self.repo.revparse_single(commit_id)
+        if len(commit.parents) > 1:
+            return ""
+        # git enables the indent heuristic by default, it picks which of equal lines are changed
+        flags = pygit2.enums.DiffOption.INDENT_HEURISTIC
+        if commit.parents:
+            diff = self.repo.diff(commit.parents[0], commit, flags=flags, context_lines=unified)
+        else:
+            diff = commit.tree.diff_to_tree(flags=flags, context_lines=unified, swap=True)
+        # Renames are detected like `git show` does by default
+        diff.find_similar()
+
+        patches = []
+        for patch in diff:
+            paths = (patch.delta.old_file.path, patch.delta.new_file.path)
+            if patterns and not any(fnmatch.fnmatchcase(path.lower(), pattern) for path in paths for pattern in patterns):
+                continue
+            patches.append(patch.data.decode("utf-8", "surrogateescape"))
+        output = "".join(patches)
+        return output[:-1] if output.endswith("\n") else output
+
+    def blame(self, rev: str, file_path: str, line_ranges: Optional[Sequence[str]] = None, options: Sequence[str] = ()) -> str:
+        flags = 0
+        for option in options:
+            if option == "-w":
+                flags |= pygit2.enums.BlameFlag.IGNORE_WHITESPACE
+            elif option == "-M":
+                flags |= pygit2.enums.BlameFlag.TRACK_COPIES_SAME_FILE
+            elif option == "-C":
+                # -C, -C -C and -C -C -C widen the search like git does
+                if flags & pygit2.enums.BlameFlag.TRACK_COPIES_SAME_COMMIT_COPIES:
+                    flags |= pygit2.enums.BlameFlag.TRACK_COPIES_ANY_COMMIT_COPIES
+                elif flags & pygit2.enums.BlameFlag.TRACK_COPIES_SAME_COMMIT_MOVES:
+                    flags |= pygit2.enums.BlameFlag.TRACK_COPIES_SAME_COMMIT_COPIES
+                else:
+                    flags |= pygit2.enums.BlameFlag.TRACK_COPIES_SAME_COMMIT_MOVES
+            else:
+                return self.fallback.blame(rev, file_path, line_ranges, options)
+
+        newest = self.repo.revparse_single(rev).id
+        blames = []
+        for lines in line_ranges or [None]:
+            kwargs = {}
+            if lines is not None:
+                start, end = lines.split(",")
+                kwargs = {"min_line": int(start), "max_line": int(end)}
+            blames.append(self.repo.blame(file_path, flags=flags, newest_commit=newest, **kwargs))
+
+        output = []
+        for blame in blames:
+            for hunk in blame:
+                commit_id = str(hunk.final_commit_id)
+                output.append(f"{commit_id} {hunk.orig_start_line_number} {hunk.final_start_line_number} {hunk.lines_in_hunk}")
+                output.extend(self.author_lines(commit_id))
+                if hunk.boundary:
+                    output.append("boundary")
+                output.append(f"filename {hunk.orig_path}")
+        return "\n".join(output)
+
+    def author_lines(self, commit_id: str) -> List[str]:
+        # Header of a commit in `git blame --incremental`, with the mailmapped author as git prints it
+        lines = self._authors.get(commit_id)
+        if lines is None:
+            commit = self.repo[commit_id]
+            author = self._mailmap.resolve_signature(commit.author)
+            offset = f"{'-' if author.offset < 0 else '+'}{abs(author.offset) // 60:02d}{abs(author.offset) % 60:02d}"
+            lines = self._authors[commit_id] = [
+                f"author {author.name}",
+                f"author-mail <{author.email}>",
+                f"author-time {author.time}",
+                f"author-tz {offset}",
+                f"summary {commit.message.splitlines()[0] if commit.message else ''}",
+            ]
+        return lines
+
+    def close(self) -> None:
+        self.fallback.close()
+        self._repo = None
+
+
+GIT_BACKENDS = {backend.name: backend for backend in (GitPythonBackend, SubprocessBackend, Pygit2Backend)}
+
+def create_git_backend(name: str, repo_path: str) -> GitBackend:
+    if name not in GIT_BACKENDS:
+        raise GitBackendError(f"Unknown git backend {name!r}, expected one of {sorted(GIT_BACKENDS)}")
+    return GIT_BACKENDS[name](repo_path)
+
+
+def blame_lines(blame_output: str) -> List[Tuple[int, str, bool, str, int]]:
+    """
+    (final line, commit id, boundary, original path, original line) of every blamed line, for comparisons.
+    """
+    return sorted(
+        (final_start + offset, sha, boundary, path, orig_start + offset)
+        for sha, boundary, path, orig_start, final_start, count, _, _ in parse_blame_groups(blame_output.splitlines())
+        for offset in range(count)
+    )
+
+def benchmark(repo_path: str, backends: List[str], max_commits: int = 200, max_blames: int = 50, unified: int = 3) -> Dict[str, Dict[str, float]]:
+    """
+    Time every operation of every backend on the same commits, files and blames, and check
+    their results against the first backend.
+
+    :returns Dict {backend: {operation: seconds}}
+    """
+    instances = {name: create_git_backend(name, repo_path) for name in backends}
+    reference = instances[backends[0]]
+
+    commits = list(reference.enumerate_commits(["HEAD"]))
+    diffs = {commit_id: reference.diff_commit(commit_id, (), unified) for commit_id in commits[:max_commits]}
+    blobs = [
+        f"{commit_id}:{line[6:]}"
+        for commit_id, diff in diffs.items() for line in diff.splitlines()
+        if line.startswith("+++ b/")
+    ]
+    blames = [blob.split(":", 1) for blob in blobs[:max_blames]]
+
+    operations = {
+        "enumerate": (lambda backend: list(backend.enumerate_commits(["HEAD"])), [None], lambda output: output),
+        "diff": (lambda backend, commit_id: backend.diff_commit(commit_id, (), unified), list(diffs), lambda output: output.splitlines()),
+        "read_blob": (lambda backend, rev: backend.read_blob(rev), blobs, lambda output: output),
+        "blame": (lambda backend, blame: backend.blame(*blame), blames, blame_lines),
+    }
+
+    results = {}
+    for name, backend in instances.items():
+        results[name] = {}
+        for operation, (call, inputs, normalize) in operations.items():
+            outputs = []
+            started = time.perf_counter()
+            for item in inputs:
+                outputs.append(call(backend) if item is None else call(backend, item))
+            elapsed = time.perf_counter() - started
+            results[name][operation] = elapsed
+
+            mismatches = 0
+            if backend is not reference:
+                expected = [call(reference) if item is None else call(reference, item) for item in inputs]
+                mismatches = sum(normalize(a) != normalize(b) for a, b in zip(outputs, expected))
+            print(f"{name:>10} {operation:>9}: {len(inputs)} calls in {elapsed:.3f}s"
+                  + (f", {mismatches} differ from {backends[0]}" if mismatches else ""))
+        backend.close()
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Git backend benchmark")
+    parser.add_argument("--repo", type=str, required=True, help="Local repository to benchmark on")
+    parser.add_argument("--backends", nargs="+", default=[name for name in GIT_BACKENDS if name != "pygit2" or pygit2 is not None],
+                        choices=list(GIT_BACKENDS), help="Backends to compare, the first one is the reference")
+    parser.add_argument("--max_commits", type=int, default=200, help="Number of commits to diff")
+    parser.add_argument("--max_blames", type=int, default=50, help="Number of files to blame")
+    parser.add_argument("--context", type=int, default=3, help="Diff context")
+    params = parser.parse_args()
+
+    benchmark(params.repo, params.backends, params.max_commits, params.max_blames, params.context)
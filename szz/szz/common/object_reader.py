@@ -0,0 +1,182 @@
+import os
+import re
+import subprocess
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+FULL_SHA = re.compile(r"^[0-9a-f]{40}(?::|$)")
+
+
+class MissingObjectError(Exception):
+    pass
+
+
+def decode_commit(content: bytes) -> str:
+    """
+    Decode a raw commit object like `git log` re-encodes it to UTF-8: from the codec of its
+    `encoding` header when it has one. Content that is not valid in that codec is kept as
+    is, like git does when the conversion fails.
+    """
+    header = content.partition(b"\n\n")[0]
+    for line in header.split(b"\n"):
+        if line.startswith(b"encoding "):
+            try:
+                return content.decode(line[9:].decode("ascii").strip())
+            except (LookupError, UnicodeDecodeError):
+                break
+    return content.decode("utf-8", "surrogateescape")
+
+
+class ObjectReader:
+    """
+    Long-lived `git cat-file --batch` / `--batch-check` reader. Every object read is a
+    round-trip over the pipes of two persistent git processes instead of a new
+    `git show` process. Decoded objects are kept in a bounded LRU cache.
+
+    The reader only uses the standard library so that it can be shared by the Miner
+    and the SZZ core. Processes are started lazily and re-started in a forked worker,
+    and they are dropped when the reader is pickled into a process pool.
+    """
+
+    def __init__(self, repo_path: str, cache_size: int = 256):
+        """
+        :param str repo_path: path of the git repository to read objects from
+        :param int cache_size: max number of decoded objects kept in the LRU cache
+        """
+        self.repo_path = repo_path
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._batch = None
+        self._batch_check = None
+        self._pid = None
+
+    def __getstate__(self) -> Dict:
+        state = self.__dict__.copy()
+        state["_cache"] = OrderedDict()
+        state["_batch"] = None
+        state["_batch_check"] = None
+        state["_pid"] = None
+        return state
+
+    def __del__(self):
+        self.close()
+
+    def _process(self, check: bool) -> subprocess.Popen:
+        if self._pid != os.getpid():
+            # Pipes inherited from another process must not be shared
+            self._batch, self._batch_check = None, None
+            self._pid = os.getpid()
+
+        process = self._batch_check if check else self._batch
+        if process is None or process.poll() is not None:
+            cmd = ["git", "-C", self.repo_path, "cat-file", "--batch-check" if check else "--batch"]
+            process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            if check:
+                self._batch_check = process
+            else:
+                self._batch = process
+        return process
+
+    @staticmethod
+    def _request(process: subprocess.Popen, rev: str) -> List[str]:
+        process.stdin.write(f"{rev}\n".encode("utf-8", "surrogateescape"))
+        process.stdin.flush()
+        header = process.stdout.readline().decode().split()
+        if len(header) != 3:
+            raise MissingObjectError(f"{rev} is missing")
+        return header
+
+    def info(self, rev: str) -> Optional[Tuple[str, str, int]]:
+        """
+        Resolve a revision with `--batch-check`.
+
+        :param str rev: any object name accepted by git, e.g. `sha` or `sha:path`
+        :returns Tuple[str, str, int] (object id, object type, size), None if missing
+        """
+        try:
+            sha, obj_type, size = self._request(self._process(check=True), rev)
+        except MissingObjectError:
+            return None
+        return sha, obj_type, int(size)
+
+    def read(self, rev: str) -> Tuple[str, bytes]:
+        """
+        Read the raw content of an object with `--batch`.
+
+        :param str rev: any object name accepted by git, e.g. `sha` or `sha:path`
+        :returns Tuple[str, bytes] (object type, raw content)
+        """
+        if rev in self._cache:
+            self._cache.move_to_end(rev)
+            return self._cache[rev]
+
+        process = self._process(check=False)
+        _, obj_type, size = self._request(process, rev)
+        content = process.stdout.read(int(size))
+        process.stdout.read(1)
+
+        # Only full commit ids are immutable, symbolic revisions are never cached
+        if FULL_SHA.match(rev):
+            self._cache[rev] = (obj_type, content)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return obj_type, content
+
+    def show(self, rev: str) -> str:
+        """
+        Drop-in replacement of `repo.git.show(rev)` for blobs: decoded content without the trailing newline.
+        """
+        _, content = self.read(rev)
+        content = content.decode("utf-8", "surrogateescape")
+        if content.endswith("\n"):
+            content = content[:-1]
+        return content
+
+    def commit_header(self, commit_id: str) -> Dict:
+        """
+        Parse a raw commit object into the fields used by the miners.
+
+        :param str commit_id: commit hash
+        :returns Dict with the `id`, `parents`, `author`, `date` (committer time), `subject` and `body`
+        """
+        obj_type, content = self.read(commit_id)
+        if obj_type != "commit":
+            raise MissingObjectError(f"{commit_id} is a {obj_type}")
+
+        content = decode_commit(content)
+        header, _, message = content.partition("\n\n")
+        parents, author, date = [], None, None
+        for line in header.split("\n"):
+            if line.startswith("parent "):
+                parents.append(line[7:])
+            elif line.startswith("author "):
+                author = line[7:].rsplit(" <", 1)[0]
+            elif line.startswith("committer "):
+                date = int(line.rsplit(" ", 2)[-2])
+
+        # Same subject/body rules as `git log --format=%s%n%B`
+        subject = []
+        for line in message.split("\n"):
+            if line.strip():
+                subject.append(line.rstrip())
+            elif subject:
+                break
+
+        return {
+            "id": commit_id,
+            "parents": parents,
+            "author": author,
+            "date": date,
+            "subject": " ".join(subject),
+            "body": message,
+        }
+
+    def close(self):
+        for process in (self._batch, self._batch_check):
+            if process is not None and self._pid == os.getpid():
+                try:
+                    process.stdin.close()
+                    process.wait()
+                except Exception:
+                    pass
+        self._batch, self._batch_check = None, None
@@ -11,6 +11,8 @@ from git import Commit, Repo
 from pydriller import ModificationType, GitRepository as PyDrillerGitRepo
 
 from options import Options
+from szz.common.git_backend import GitBackend, create_git_backend, parse_blame_groups
+from szz.common.object_reader import ObjectReader
 from szz.core.comment_parser import parse_comments
 
 
@@ -18,7 +20,8 @@ class AbstractSZZ(ABC):
     """
     AbstractSZZ is the base class for SZZ implementations. It has core methods for SZZ
     like blame and a diff parsing for impacted files. GitPython is used for base Git
-    commands and PyDriller to parse commit modifications.
+    commands, the git backend of `Options.GIT_BACKEND` for blame and PyDriller to parse
+    commit modifications.
     """
 
     def __init__(self, repo_full_name: str, repo_url: str, repos_dir: str = None, logger: log.Logger = None):
@@ -55,6 +58,8 @@ class AbstractSZZ(ABC):
                 Repo.clone_from(url=repo_url, to_path=self._repository_path)
 
         self._repository = Repo(self._repository_path)
+        self._object_reader = ObjectReader(self._repository_path)
+        self._git_backend = create_git_backend(Options.GIT_BACKEND, self._repository_path)
 
     def __del__(self):
         self.logger.info("cleanup objects...")
@@ -70,6 +75,24 @@ class AbstractSZZ(ABC):
         """
         return self._repository
 
+    @property
+    def object_reader(self) -> ObjectReader:
+        """
+         Getter of the persistent `git cat-file` reader of the current repository.
+
+         :returns ObjectReader object_reader
+        """
+        return self._object_reader
+
+    @property
+    def git_backend(self) -> GitBackend:
+        """
+         Getter of the git backend used for blame.
+
+         :returns GitBackend git_backend
+        """
+        return self._git_backend
+
     @property
     def repository_path(self) -> str:
         """
@@ -165,32 +188,36 @@ class AbstractSZZ(ABC):
         :returns Set[BlameData] a set of bug introducing commits candidates, represented by BlameData object
         """
 
-        kwargs = dict()
+        options = list()
         if ignore_whitespaces:
-            kwargs['w'] = True
+            options.append('-w')
         if ignore_revs_file_path:
-            kwargs['ignore-revs-file'] = ignore_revs_file_path
+            options.append(f'--ignore-revs-file={ignore_revs_file_path}')
         if ignore_revs_list:
-            kwargs['ignore-rev'] = list(ignore_revs_list)
+            options.extend(f'--ignore-rev={ignore_rev}' for ignore_rev in ignore_revs_list)
         if detect_move_within_file:
-            kwargs['M'] = True
+            options.append('-M')
         if detect_move_from_other_files and detect_move_from_other_files == DetectLineMoved.SAME_COMMIT:
-            kwargs['C'] = True
+            options.append('-C')
         if detect_move_from_other_files and detect_move_from_other_files == DetectLineMoved.PARENT_COMMIT:
-            kwargs['C'] = [True, True]
+            options.extend(['-C'] * 2)
         if detect_move_from_other_files and detect_move_from_other_files == DetectLineMoved.ANY_COMMIT:
-            kwargs['C'] = [True, True, True]
+            options.extend(['-C'] * 3)
 
         bug_introd_commits = set()
+        commits = dict()
         mod_line_ranges = self._parse_line_ranges(modified_lines)
         self.logger.info(f"processing file: {file_path}")
-        for entry in self.repository.blame_incremental(**kwargs, rev=rev, L=mod_line_ranges, file=file_path):
-            # entry.linenos = input lines to blame (current lines)
-            # entry.orig_lineno = output line numbers from blame (previous commit lines from blame)
-            for line_num in entry.orig_linenos:
-                source_file_content = self.repository.git.show(f"{entry.commit.hexsha}:{entry.orig_path}")
+        blame_output = self.git_backend.blame(rev, file_path, mod_line_ranges, options)
+        for commit_hash, _, orig_path, orig_start, _, count, _, _ in parse_blame_groups(blame_output.splitlines()):
+            # orig_start = first output line number from blame (previous commit lines from blame)
+            commit = commits.get(commit_hash)
+            if commit is None:
+                commit = commits[commit_hash] = self.repository.commit(commit_hash)
+            for line_num in range(orig_start, orig_start + count):
+                source_file_content = self.object_reader.show(f"{commit_hash}:{orig_path}")
                 line_str = source_file_content.split('\n')[line_num - 1].strip()
-                b_data = BlameData(entry.commit, line_num, line_str, entry.orig_path)
+                b_data = BlameData(commit, line_num, line_str, orig_path)
 
                 if skip_comments and self._is_comment(line_num, source_file_content, ntpath.basename(b_data.file_path)):
                     self.logger.info(f"skip comment line ({line_num}): {line_str}")
@@ -257,7 +284,7 @@ class AbstractSZZ(ABC):
         assert not self.repository.head.is_detached
 
     def _get_impacted_file_content(self, fix_commit_hash: str, impacted_file: 'ImpactedFile') -> str:
-        return self.repository.git.show(f"{fix_commit_hash}:{impacted_file.file_path}")
+        return self.object_reader.show(f"{fix_commit_hash}:{impacted_file.file_path}")
 
     def get_commit(self, hash: str) -> Commit:
         """ return the Commit object for the given hash """
@@ -270,6 +297,10 @@ class AbstractSZZ(ABC):
 
     def __clear_gitpython(self):
         """ Cleanup of GitPython due to memory problems """
+        if getattr(self, "_object_reader", None):
+            self._object_reader.close()
+        if getattr(self, "_git_backend", None):
+            self._git_backend.close()
         if self._repository:
             self._repository.close()
             self._repository.__del__()
@@ -93,7 +93,7 @@ class DFSZZ(MASZZ):
                     log.warning(f"skip file not supported by define-use chains parser: {imp_file.file_path}")
                     continue
 
-                source_file_content = self.repository.git.show(f"{fix_commit_hash}:{imp_file.file_path}")
+                source_file_content = self.object_reader.show(f"{fix_commit_hash}:{imp_file.file_path}")
                 ast_xml = SrcML().parse_file(imp_file.file_path, source_file_content)
                 lines_to_blame = self._select_def_use_lines(imp_file, ast_xml, cutoff_distance)
                 log.info(f"added lines to blame={lines_to_blame} for file={imp_file.file_path}")
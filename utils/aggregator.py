@@ -1,21 +1,79 @@
-def aggregator(parsed_lines_iterable):
-    def set_once(root, path, value):
-        original_path = list(path)
+def set_once(root, path, value):
+    original_path = list(path)
+
+    path = list(path)
+    last_key = path.pop()
+
+    for key in path:
+        root = root[key]
+
+    if last_key in root:
+        raise KeyError("{!r} is already set".format(original_path))
+
+    root[last_key] = value
+
+
+def aggregate_header(file_diff, state, parsed, line):
+    """
+    Apply one header line of a file diff other than `diff --git`. Shared by `aggregator`
+    and `slotted_aggregator`, whose file diffs are both indexed by their dict keys.
+    """
+    if state == "chunk_header":
+        file_diff["meta_a"]["lines"] += parsed["from_line_count"]
+        file_diff["meta_b"]["lines"] += parsed["to_line_count"]
+        return
+
+    if state == "new_file_mode_header":
+        set_once(file_diff, ("from", "mode",), "0000000")
+        set_once(file_diff, ("to",   "mode",), parsed["mode"])
+        return
+
+    if state == "old_mode_header":
+        set_once(file_diff, ("from", "mode",), parsed["mode"])
+        return
+
+    if state == "new_mode_header":
+        set_once(file_diff, ("to", "mode",), parsed["mode"])
+        return
+
+    if state == "deleted_file_mode_header":
+        set_once(file_diff, ("from", "mode",), parsed["mode"])
+        set_once(file_diff, ("to",   "mode",), "0000000")
+        return
 
-        path = list(path)
-        last_key = path.pop()
+    if state in ("a_file_change_header", "b_file_change_header"):
+        key = {"a_file_change_header": "from", "b_file_change_header": "to"}[state]
+        if file_diff[key]["file"] != parsed["file"] and parsed["file"] is not None:
+            raise ValueError(f"Unexpected diff line in {file_diff[key]['file']}: {line!r}")
+        return
 
-        for key in path:
-            root = root[key]
+    if state == "binary_diff":
+        file_diff["is_binary"] = True
+        return
 
-        if last_key in root:
-            raise KeyError("{!r} is already set".format(original_path))
+    if state == "rename_header":
+        if "100" in parsed["rate"]:
+            file_diff["rename"] = True
+        return
 
-        root[last_key] = value
+    if state in ("rename_a_file", "rename_b_file"):
+        return
 
+    if state == "index_diff_header":
+        set_once(file_diff, ("from", "blob",), parsed["from_blob"])
+        set_once(file_diff, ("to", "blob",), parsed["to_blob"])
+        if parsed["mode"] is not None:
+            set_once(file_diff, ("from", "mode",), parsed["mode"])
+            set_once(file_diff, ("to", "mode"), parsed["mode"])
+        return
+
+    raise ValueError(f"Unexpected {state!r} line in {file_diff['to']['file']}: {line!r}")
+
+
+def aggregator(parsed_lines_iterable):
     file_diff = None
     file_meta = None
-    for state, parsed, _ in parsed_lines_iterable:
+    for state, parsed, line in parsed_lines_iterable:
         if state == "file_diff_header":
             if file_diff is not None:
                 yield file_diff
@@ -47,59 +105,6 @@ def aggregator(parsed_lines_iterable):
             file_diff["content"] = []
             continue
 
-        if state == "new_file_mode_header":
-            set_once(file_diff, ("from", "mode",), "0000000")
-            set_once(file_diff, ("to",   "mode",), parsed["mode"])
-            continue
-
-        if state == "old_mode_header":
-            set_once(file_diff, ("from", "mode",), parsed["mode"])
-            continue
-
-        if state == "new_mode_header":
-            set_once(file_diff, ("to", "mode",), parsed["mode"])
-            continue
-
-        if state == "deleted_file_mode_header":
-            set_once(file_diff, ("from", "mode",), parsed["mode"])
-            set_once(file_diff, ("to",   "mode",), "0000000")
-            continue
-
-        if state in ("a_file_change_header", "b_file_change_header"):
-            key = {"a_file_change_header": "from", "b_file_change_header": "to"}[state]
-            if file_diff[key]["file"] != parsed["file"] and parsed["file"] is not None:
-                print(file_diff, parsed)
-                raise Exception("TODO: Exception text")
-            continue
-
-        if state == "binary_diff":
-            file_diff["is_binary"] = True
-            continue
-
-        if state == "rename_header":
-            if "100" in parsed["rate"]:
-                file_diff["rename"] = True
-            continue
-
-        if state == "rename_a_file":
-            continue
-
-        if state == "rename_b_file":
-            continue
-
-        if state == "index_diff_header":
-            set_once(file_diff, ("from", "blob",), parsed["from_blob"])
-            set_once(file_diff, ("to", "blob",), parsed["to_blob"])
-            if parsed["mode"] is not None:
-                set_once(file_diff, ("from", "mode",), parsed["mode"])
-                set_once(file_diff, ("to", "mode"), parsed["mode"])
-            continue
-
-        if state == "chunk_header":
-            file_diff["meta_a"]["lines"] += parsed["from_line_count"]
-            file_diff["meta_b"]["lines"] += parsed["to_line_count"]
-            continue
-
         if state == "line_diff":
 
             if parsed["action"] == " ":
@@ -135,11 +140,201 @@ def aggregator(parsed_lines_iterable):
         if state == "no_newline":
             file_meta["no_newline_count"] += 1
             if file_meta["no_newline_count"] > 2:
-                raise Exception("TODO: Exception text")
+                raise ValueError(f"Unexpected diff line in {file_diff['to']['file']}: {line!r}")
             file_diff["to"]["end_newline"] = False
             continue
 
-        raise Exception("Unexpected {!r} line".format(state))
+        aggregate_header(file_diff, state, parsed, line)
 
     if file_diff is not None:
-        yield file_diff
\ No newline at end of file
+        yield file_diff
+
+def set_line_counts(file_diff, from_lines):
+    """
+    Fill `meta_a`/`meta_b` line counts of a diff mined with bounded context, whose
+    chunk headers only count the lines around the changes.
+    """
+    added = sum(len(chunk.get("b", [])) for chunk in file_diff["content"])
+    deleted = sum(len(chunk.get("a", [])) for chunk in file_diff["content"])
+    file_diff["meta_a"]["lines"] = from_lines
+    file_diff["meta_b"]["lines"] = from_lines + added - deleted
+
+
+class Chunk:
+    """
+    One `content` chunk of a FileDiff: either context lines (`ab`) or a change with deleted
+    (`a`) and/or added (`b`) lines. Reads like the chunk dict of `aggregator`.
+    """
+    __slots__ = ("ab", "a", "b", "b_first")
+
+    def __init__(self, ab=None, a=None, b=None):
+        self.ab = ab
+        self.a = a
+        self.b = b
+        self.b_first = a is None and b is not None
+
+    def __contains__(self, key):
+        return getattr(self, key, None) is not None if key in ("ab", "a", "b") else False
+
+    def __getitem__(self, key):
+        value = getattr(self, key, None) if key in ("ab", "a", "b") else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in ("ab", "a", "b") else None
+        return default if value is None else value
+
+    def to_dict(self):
+        if self.ab is not None:
+            return {"ab": self.ab}
+        chunk = {}
+        for key in (("b", "a") if self.b_first else ("a", "b")):
+            value = getattr(self, key)
+            if value is not None:
+                chunk[key] = value
+        return chunk
+
+
+class FileDiff:
+    """
+    File diff of `slotted_aggregator`. The small `from`/`to`/`meta_a`/`meta_b` parts stay
+    dicts, the content is a list of slotted Chunks. Reads like the dict of `aggregator`
+    and `to_dict` gives that dict, key order included.
+    """
+    __slots__ = ("from_", "to", "is_binary", "rename", "meta_a", "meta_b", "content")
+
+    KEYS = {"from": "from_", "to": "to", "is_binary": "is_binary", "rename": "rename",
+            "meta_a": "meta_a", "meta_b": "meta_b", "content": "content"}
+
+    def __init__(self, from_file, to_file):
+        self.from_ = {"file": from_file, "end_newline": True}
+        self.to = {"file": to_file, "end_newline": True}
+        self.is_binary = False
+        self.rename = False
+        self.meta_a = {"name": from_file, "lines": 0}
+        self.meta_b = {"name": to_file, "lines": 0}
+        self.content = []
+
+    def __getitem__(self, key):
+        if key == "chunks":
+            return []
+        return getattr(self, self.KEYS[key])
+
+    def __setitem__(self, key, value):
+        setattr(self, self.KEYS[key], value)
+
+    def to_dict(self):
+        return {
+            "from": self.from_,
+            "to": self.to,
+            "is_binary": self.is_binary,
+            "chunks": [],
+            "rename": self.rename,
+            "meta_a": self.meta_a,
+            "meta_b": self.meta_b,
+            "content": [chunk.to_dict() for chunk in self.content],
+        }
+
+
+def slotted_aggregator(parsed_lines_iterable):
+    """
+    Same file diffs as `aggregator`, built as FileDiff objects with one attribute lookup per
+    diff line instead of nested dict walks. Serialize them with `to_dict`.
+    """
+    file_diff = None
+    no_newline_count = 0
+    chunk = None
+    for state, parsed, line in parsed_lines_iterable:
+        if state == "line_diff":
+            action, line = parsed["action"], parsed["line"]
+            if action == " ":
+                if chunk is not None and chunk.ab is not None:
+                    chunk.ab.append(line)
+                else:
+                    chunk = Chunk(ab=[line])
+                    file_diff.content.append(chunk)
+            elif action == "+":
+                if chunk is not None and chunk.ab is None:
+                    if chunk.b is not None:
+                        chunk.b.append(line)
+                    else:
+                        chunk.b = [line]
+                else:
+                    chunk = Chunk(b=[line])
+                    file_diff.content.append(chunk)
+            elif action == "-":
+                if chunk is not None and chunk.ab is None:
+                    if chunk.a is not None:
+                        chunk.a.append(line)
+                    else:
+                        chunk.a = [line]
+                else:
+                    chunk = Chunk(a=[line])
+                    file_diff.content.append(chunk)
+
+            if no_newline_count > 0:
+                file_diff.to["end_newline"] = True
+                file_diff.from_["end_newline"] = False
+            continue
+
+        if state == "file_diff_header":
+            if file_diff is not None:
+                yield file_diff
+            file_diff = FileDiff(parsed["from_file"], parsed["to_file"])
+            no_newline_count = 0
+            chunk = None
+            continue
+
+        if state == "no_newline":
+            no_newline_count += 1
+            if no_newline_count > 2:
+                raise ValueError(f"Unexpected diff line in {file_diff.to['file']}: {line!r}")
+            file_diff.to["end_newline"] = False
+            continue
+
+        aggregate_header(file_diff, state, parsed, line)
+
+    if file_diff is not None:
+        yield file_diff
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+    from utils.line_parser import load_corpus, parse_lines, record_corpus
+
+    parser = argparse.ArgumentParser(description="Diff aggregation microbenchmark")
+    parser.add_argument("--corpus", type=str, required=True, help="Recorded `git log -p --format=%%x00` output")
+    parser.add_argument("--record", type=str, default=None, help="Record the corpus from this repository first")
+    parser.add_argument("--max_count", type=int, default=1000, help="Number of commits to record")
+    parser.add_argument("--repeat", type=int, default=3)
+    params = parser.parse_args()
+
+    if params.record:
+        record_corpus(params.record, params.corpus, params.max_count)
+    files_parsed = [list(parse_lines(log)) for log in load_corpus(params.corpus)]
+    n_lines = sum(len(parsed) for parsed in files_parsed)
+
+    timings, outputs = {}, {}
+    for name, aggregate, to_dict in (
+            ("dict", aggregator, lambda file_diff: file_diff),
+            ("slotted", slotted_aggregator, FileDiff.to_dict)):
+        build, write = None, None
+        for _ in range(params.repeat):
+            started = time.perf_counter()
+            diffs = [file_diff for parsed in files_parsed for file_diff in aggregate(parsed)]
+            built = time.perf_counter()
+            dumped = [json.dumps(to_dict(file_diff)) for file_diff in diffs]
+            written = time.perf_counter()
+            build = built - started if build is None else min(build, built - started)
+            write = written - built if write is None else min(write, written - built)
+        outputs[name] = dumped
+        timings[name] = build + write
+        print(f"{name}: build {build:.3f}s, serialize {write:.3f}s, {n_lines / (build + write):,.0f} lines/sec")
+
+    if outputs["dict"] != outputs["slotted"]:
+        raise AssertionError("slotted_aggregator disagrees with aggregator")
+    print(f"speedup: {timings['dict'] / timings['slotted']:.2f}x")
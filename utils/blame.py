@@ -0,0 +1,326 @@
+import hashlib
+import json
+import os
+import subprocess
+import uuid
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+LineOrigin = Tuple[str, str, int]
+
+
+class IncrementalBlame:
+    """
+    Derive `git blame {parent_id} -- {file}` from an earlier blame of the same file plus the
+    diffs mined in between, instead of running a full blame for every commit.
+
+    For every file it keeps the per-line origins (id, author, time) valid at the last mined
+    commit that changed it. The state is reused for a later parent only when the parent
+    reaches that commit through mined, single-parent commits that did not touch the file.
+    Merges, renames, deletions, unknown commits or diffs that do not match the stored
+    pre-image drop the state, and the Miner falls back to a real `git blame`.
+    """
+
+    def __init__(self, repo_path: str, max_walk: int = 1000):
+        """
+        :param str repo_path: path of the git repository
+        :param int max_walk: max number of commits walked back from a parent to find the state
+        """
+        self.repo_path = repo_path
+        self.max_walk = max_walk
+
+        self.authors = {}
+        """
+        {
+            commit_id: (author as printed by git blame, author time)
+        }
+        """
+
+        self.parents = {}
+        """
+        {
+            commit_id: [parent_id, ...]
+        }
+        """
+
+        self.touched = {}
+        """
+        {
+            commit_id: set(file paths on both sides of its diff)
+        }
+        """
+
+        self.files = {}
+        """
+        {
+            file_name: (commit_id, [line origin, ...])
+        }
+        """
+
+    def prefetch(self, commit_ids: List[str]) -> None:
+        "git log --no-walk=unsorted --stdin --format=%H%x00%aN%x00%at"
+        """
+        Read the (mailmapped) author and author time of a batch of commits with one process,
+        exactly as `git blame -t` prints them for the lines a commit adds.
+        """
+        cmd = ["git", "-C", self.repo_path, "log", "--no-walk=unsorted", "--stdin", "--format=%H%x00%aN%x00%at"]
+        out = subprocess.run(
+            cmd, input="".join(f"{commit_id}\n" for commit_id in commit_ids).encode(),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        ).stdout.decode("utf-8", "surrogateescape")
+        for line in out.splitlines():
+            commit_id, author, date = line.split("\x00")
+            # The blame parsers collapse the whitespace of author names
+            self.authors[commit_id] = (" ".join(author.split()), int(date))
+
+    def lookup(self, parent_id: str, file_name: str) -> Optional[List[LineOrigin]]:
+        """
+        :param str parent_id: revision that would be blamed
+        :param str file_name: path of the file at `parent_id`
+        :returns List[LineOrigin] the derived blame, None if a real `git blame` is needed
+        """
+        state = self.files.get(file_name)
+        if state is None:
+            return None
+
+        state_id, line_blame = state
+        current = parent_id
+        for _ in range(self.max_walk):
+            if current == state_id:
+                return line_blame
+            parents = self.parents.get(current)
+            if parents is None or len(parents) != 1 or file_name in self.touched[current]:
+                return None
+            current = parents[0]
+        return None
+
+    def update(self, commit_id: str, parent_id: str, touched: Set[str],
+               pre_images: Dict[str, Tuple[str, List[LineOrigin], List[Tuple[int, int, int]]]], commit_diff: Dict) -> None:
+        """
+        Record a mined commit and replay its diff on the blames of its parent.
+
+        :param str commit_id: mined commit
+        :param str parent_id: parents of the mined commit, space separated
+        :param Set[str] touched: every path on both sides of the commit's diff
+        :param Dict pre_images: {file_name_b: (file_name_a, blame of file_name_a at parent_id, hunks of the diff)}
+        :param Dict commit_diff: {file_name_b: file diff from `aggregator`}
+        """
+        self.parents[commit_id] = parent_id.split()
+        self.touched[commit_id] = touched
+        for file_name in touched:
+            self.files.pop(file_name, None)
+
+        author = self.authors.get(commit_id)
+        if author is None:
+            return
+        origin = (commit_id, author[0], author[1])
+
+        for file_name_b, (file_name_a, line_blame, hunks) in pre_images.items():
+            file_diff = commit_diff[file_name_b]
+            if file_name_a != file_name_b or file_diff["to"]["mode"] == "0000000":
+                continue
+            new_line_blame = replay_diff(line_blame, file_diff["content"], hunks, origin)
+            if new_line_blame is not None:
+                self.files[file_name_b] = (commit_id, new_line_blame)
+
+
+class BlameCache:
+    """
+    On-disk cache of whole-file blames (the `get_file_blame_incremental` structure), keyed by the
+    pre-image blob id printed on the `index` line of the diff and the path of the file.
+
+    The same pre-image is blamed again by cherry-picks, reverts and backports on other
+    branches. Their lines are then credited to the commits of the first blame, which only
+    differs from a real `git blame` when the two histories reached the blob through other commits.
+
+    Entries are JSON files laid out like loose git objects and shared by all the workers.
+    Hits refresh their mtime; `evict` drops the least recently used entries above `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        :param str cache_dir: directory of the cache, created if needed
+        :param int max_bytes: size of the cache kept by `evict`
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # Bytes stored by this process since its last eviction
+        self.written = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, blob: str, file_name: str) -> str:
+        key = hashlib.sha256(f"{blob}\0{file_name}".encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key[2:] + ".json")
+
+    def get(self, blob: str, file_name: str) -> Optional[Dict]:
+        path = self.path(blob, file_name)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        # Guard against a hash collision, however unlikely
+        if entry.get("blob") != blob or entry.get("file") != file_name:
+            return None
+        return entry["blame"]
+
+    def put(self, blob: str, file_name: str, file_blame: Dict) -> None:
+        path = self.path(blob, file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"blob": blob, "file": file_name, "blame": file_blame}, separators=(",", ":"))
+        # Written aside then renamed, so that other workers never read a partial entry
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.written += len(data)
+        if self.written > self.max_bytes // 10:
+            self.evict()
+
+    def evict(self) -> Tuple[int, int]:
+        """
+        Remove the least recently used entries until the cache fits in `max_bytes`.
+        :returns (removed entries, bytes left in the cache)
+        """
+        self.written = 0
+        entries = []
+        for fan_out in os.scandir(self.cache_dir):
+            if not fan_out.is_dir():
+                continue
+            for entry in os.scandir(fan_out.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        removed = 0
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                # Evicted by another worker
+                pass
+            size -= entry_size
+        return removed, size
+
+
+def walk_diff(content: List[Dict], hunks: List[Tuple[int, int, int]]) -> Iterator[Tuple[str, int, int]]:
+    """
+    Walk a diff as (kind, from_index, count) segments, where `kind` is "=" for unchanged lines,
+    "-" for deleted lines and "+" for added lines, and `from_index` is the 0-based position in
+    the pre-image. Lines outside the hunks are yielded as "=", except after the last hunk.
+
+    :param List[Dict] content: `content` chunks of a file diff from `aggregator`
+    :param List[Tuple[int, int, int]] hunks: (from_line_start, from_line_count, to_line_count) of every chunk header
+    :raises ValueError: if the chunks do not match the hunk headers
+    """
+    ops = []
+    for chunk in content:
+        if "ab" in chunk:
+            ops.append(["=", len(chunk["ab"])])
+            continue
+        if chunk.get("a"):
+            ops.append(["-", len(chunk["a"])])
+        if chunk.get("b"):
+            ops.append(["+", len(chunk["b"])])
+
+    line_index = 0
+    op_index = 0
+    for from_start, from_count, to_count in hunks:
+        # Unchanged lines between two hunks; an empty hunk side starts after `from_start`
+        gap_end = from_start - 1 if from_count > 0 else from_start
+        if gap_end < line_index:
+            raise ValueError(f"Hunk at line {from_start} overlaps the previous one")
+        if gap_end > line_index:
+            yield "=", line_index, gap_end - line_index
+        line_index = gap_end
+
+        # Context merged by `aggregator` across two hunks is split again on the line counts
+        while from_count > 0 or to_count > 0:
+            if op_index == len(ops):
+                raise ValueError("Diff is shorter than its hunk headers")
+            kind, count = ops[op_index]
+            if kind == "=":
+                take = min(count, from_count, to_count)
+                from_count -= take
+                to_count -= take
+            elif kind == "-":
+                take = min(count, from_count)
+                from_count -= take
+            else:
+                take = min(count, to_count)
+                to_count -= take
+            if take == 0:
+                raise ValueError("Diff does not match its hunk headers")
+            yield kind, line_index, take
+            if kind != "+":
+                line_index += take
+            if take == count:
+                op_index += 1
+            else:
+                ops[op_index][1] = count - take
+
+    if op_index != len(ops):
+        raise ValueError("Diff is longer than its hunk headers")
+
+
+def replay_diff(line_blame: List[LineOrigin], content: List[Dict], hunks: List[Tuple[int, int, int]],
+                origin: LineOrigin) -> Optional[List[LineOrigin]]:
+    """
+    Apply a diff to the per-line origins of its pre-image. Lines outside the hunks are kept,
+    so the diff may use any context size.
+
+    :param List[LineOrigin] line_blame: origins of the pre-image lines
+    :param List[Dict] content: `content` chunks of a file diff from `aggregator`
+    :param List[Tuple[int, int, int]] hunks: (from_line_start, from_line_count, to_line_count) of every chunk header
+    :param LineOrigin origin: origin of the lines added by the diff
+    :returns List[LineOrigin] origins of the post-image lines, None if the diff does not match the pre-image
+    """
+    new_line_blame = []
+    line_index = 0
+    try:
+        for kind, from_index, count in walk_diff(content, hunks):
+            if kind == "+":
+                new_line_blame.extend([origin] * count)
+                continue
+            line_index = from_index + count
+            if line_index > len(line_blame):
+                return None
+            if kind == "=":
+                new_line_blame.extend(line_blame[from_index:line_index])
+    except ValueError:
+        return None
+
+    new_line_blame.extend(line_blame[line_index:])
+    return new_line_blame
+
+
+def deleted_lines(content: List[Dict], hunks: List[Tuple[int, int, int]]) -> List[int]:
+    """
+    1-based numbers of the pre-image lines that a diff deletes or modifies.
+
+    :raises ValueError: if the chunks do not match the hunk headers
+    """
+    return [
+        from_index + offset + 1
+        for kind, from_index, count in walk_diff(content, hunks) if kind == "-"
+        for offset in range(count)
+    ]
+
+
+def line_ranges(lines: List[int]) -> List[str]:
+    """
+    Fold sorted line numbers into `git blame -L start,end` ranges, e.g. [3, 4, 5, 9] -> ['3,5', '9,9']
+    """
+    ranges = []
+    for line in lines:
+        if ranges and line == ranges[-1][1] + 1:
+            ranges[-1][1] = line
+        else:
+            ranges.append([line, line])
+    return [f"{start},{end}" for start, end in ranges]
@@ -1,5 +1,7 @@
 import re
 
+from szz.szz.common.git_backend import parse_blame_groups
+
 FILE_DIFF_HEADER = [
     re.compile(r"^diff --git a/(?P<from_file>.*?)\s* b/(?P<to_file>.*?)\s*$"),
     re.compile(
@@ -63,7 +65,22 @@ def parse_lines(line_iterable):
             yield state, parsed, line
 
 
+# States after which a `+`, `-` or ` ` line can only be a line diff
+LINE_DIFF_STATES = frozenset(("chunk_header", "line_diff", "no_newline"))
+
+
 def parse_line(line, prev_state):
+    """
+    Fast path of `parse_line_regex` for the diff lines of a chunk, which are nearly all the
+    lines of a diff: no header pattern can match a line starting with `+`, `-` or ` `, so
+    LINE_DIFF is answered from the first character. Every other line takes the regex path.
+    """
+    if prev_state in LINE_DIFF_STATES and line and line[0] in "+- " and "\n" not in line:
+        return "line_diff", {"action": line[0], "line": line[1:]}
+    return parse_line_regex(line, prev_state)
+
+
+def parse_line_regex(line, prev_state):
     # "diff --git a/{TO_FILE} b/{TO_FILE}""
     if prev_state in (
             "start_of_file",
@@ -198,79 +215,206 @@ def split_diff_log(file_diff_log):
     """
     Split the log of a commit into a list of diff
     """
-    files_log, file_log = [], []
+    return list(iter_diff_log(file_diff_log))
+
+def iter_diff_log(file_diff_log, marker="diff --git"):
+    """
+    Same diffs as `split_diff_log`, one at a time, so that the log can be a stream of lines.
+    Lines read as bytes are split with marker=b"diff --git"
+    """
+    file_log = []
     for line in file_diff_log:
-        if line[:10] == "diff --git":
+        if line[:10] == marker:
             if file_log:
-                files_log.append(file_log)
+                yield file_log
             file_log = []
             file_log.append(line)
         else:
             file_log.append(line)
 
     if file_log:
-        files_log.append(file_log)
+        yield file_log
 
-    return files_log
+def diff_header_length(file_log):
+    """
+    Number of lines of a bytes file diff log before its `---` line, i.e. the lines that name
+    the files, their modes and blobs. They parse on their own into a file diff without content
+    """
+    for index, line in enumerate(file_log):
+        if line[:4] == b"--- " or line[:13] == b"Binary files ":
+            return index
+    return len(file_log)
+
+def decode_file_log(file_log, errors="surrogateescape"):
+    """
+    Decode a file diff log read as bytes lines. The lines before the first chunk are decoded
+    like GitPython output so that paths are unchanged, the chunks with the `errors` policy of
+    `bytes.decode`. Raises UnicodeDecodeError with errors="strict"
+    """
+    header = next((index for index, line in enumerate(file_log) if line[:3] == b"@@ "), len(file_log))
+    return (
+        [line.decode("utf-8", "surrogateescape") for line in file_log[:header]]
+        + [line.decode("utf-8", errors) for line in file_log[header:]]
+    )
 
-def get_file_blame(file_blame_log):
-    file_blame_log = [log.strip("\t").strip() for log in file_blame_log]
+def group_line_blame(line_blame, lines=None):
+    """
+    Group per-line origins into the same id2line structure as `get_file_blame_incremental`,
+    optionally restricted to the sorted 1-based `lines`
+    """
+    if lines is None:
+        lines = range(1, len(line_blame) + 1)
     id2line = {}
-    for _, log in enumerate(file_blame_log):
-        line_blame = process_one_line_blame(log)
-
-        if not line_blame["blame_id"] in id2line:
-            id2line[line_blame["blame_id"]] = {
-                "id": line_blame["blame_id"],
-                "author": line_blame["blame_author"],
-                "time": line_blame["blame_date"],
+    for this_line in lines:
+        blame_id, author, date = line_blame[this_line - 1]
+        idb = id2line.get(blame_id)
+        if idb is None:
+            idb = id2line[blame_id] = {
+                "id": blame_id,
+                "author": author,
+                "time": date,
                 "ranges": [],
             }
 
-        idb = id2line[line_blame["blame_id"]]
-        this_line = line_blame["blame_line_b"]
         ranges = idb["ranges"]
-        if ranges:
-            if this_line == ranges[-1]["end"] + 1:
-                ranges[-1]["end"] += 1
-            else:
-                ranges.append({"start": this_line, "end": this_line})
+        if ranges and this_line == ranges[-1]["end"] + 1:
+            ranges[-1]["end"] += 1
         else:
             ranges.append({"start": this_line, "end": this_line})
     return id2line
 
-def process_one_line_blame(log):
-    log = log.split()
-    while not is_numeric_string(log[1]):
-        log.remove(log[1])
-    log = " ".join(log)
-
-    pattern = r"(\S+)\s+(\d+)\s+\((.*?)\s+(\d+)\s+[-+]\d{4}\s+(\d+)\)(.*)"
-
-    # Extract the information using the pattern
-    match = re.match(pattern, log)
-
-    if match:
-        # Extract the matched components
-        commit_id = match.group(1)
-        blame_line_a = int(match.group(2))
-        author_name = match.group(3)
-        date = int(match.group(4))
-        blame_line_b = int(match.group(5))
-
-        # Create a dictionary with the extracted information
-        return {
-            "blame_id": commit_id,
-            "blame_line_a": blame_line_a,
-            "blame_author": author_name,
-            "blame_date": date,
-            "blame_line_b": blame_line_b,
-        }
-    return None
-
-def is_numeric_string(string):
-    # Regular expression pattern to match decimal numbers
-    pattern = r"^[+-]?\d*\.?\d+$"
-
-    # Check if the string matches the pattern
-    return re.match(pattern, string) is not None
\ No newline at end of file
+def expand_file_blame(file_blame):
+    """
+    Per-line origins of a whole-file id2line structure, the inverse of `group_line_blame`.
+    Returns None if the ranges do not cover the file exactly once
+    """
+    line_count = sum(r["end"] - r["start"] + 1 for blame in file_blame.values() for r in blame["ranges"])
+    line_blame = [None] * line_count
+    for blame in file_blame.values():
+        origin = (blame["id"], blame["author"], blame["time"])
+        for r in blame["ranges"]:
+            if r["start"] < 1 or r["end"] > line_count:
+                return None
+            line_blame[r["start"] - 1:r["end"]] = [origin] * (r["end"] - r["start"] + 1)
+    if None in line_blame:
+        return None
+    return line_blame
+
+def parse_blame_incremental(blame_log):
+    "git blame --incremental {rev} -- {file}"
+    """
+    (id, author, time, start, count) groups of consecutive lines of `parse_blame_groups`, in
+    output order, with `id`/`author` as `git blame -t -n -l` prints them: boundary commits
+    as `^` and 39 hex digits, whitespace of author names collapsed.
+    """
+    return [
+        (f"^{sha[:39]}" if boundary else sha, " ".join(author.split()), author_time, start, count)
+        for sha, boundary, _, _, start, count, author, author_time in parse_blame_groups(blame_log)
+    ]
+
+def get_file_blame_incremental(blame_log):
+    """
+    Whole-file blame of every commit: {id: {id, author, time, ranges}} with the ranges of
+    consecutive 1-based lines, built from the line groups of `git blame --incremental`
+    """
+    id2line = {}
+    for blame_id, author, date, start, count in sorted(parse_blame_incremental(blame_log), key=lambda group: group[3]):
+        idb = id2line.get(blame_id)
+        if idb is None:
+            idb = id2line[blame_id] = {
+                "id": blame_id,
+                "author": author,
+                "time": date,
+                "ranges": [],
+            }
+
+        ranges = idb["ranges"]
+        if ranges and start == ranges[-1]["end"] + 1:
+            ranges[-1]["end"] += count
+        else:
+            ranges.append({"start": start, "end": start + count - 1})
+    return id2line
+
+def get_line_blame_incremental(blame_log):
+    """
+    One (id, author, time) origin per line of the file, from a whole-file `git blame --incremental`
+    """
+    line_blame = []
+    for blame_id, author, date, _, count in sorted(parse_blame_incremental(blame_log), key=lambda group: group[3]):
+        line_blame.extend([(blame_id, author, date)] * count)
+    return line_blame
+
+def record_corpus(repo_path, corpus_file, max_count=1000, unified=999999999):
+    "git log -p --format=%x00 -n {max_count} --unified={unified}"
+    """
+    Save the diffs of the last `max_count` commits of a repository as a benchmark corpus.
+    """
+    import subprocess
+    cmd = ["git", "-C", repo_path, "log", "-p", "--no-color", "--format=%x00", f"-n{max_count}", f"--unified={unified}"]
+    with open(corpus_file, "wb") as f:
+        subprocess.run(cmd, stdout=f, check=True)
+
+def load_corpus(corpus_file):
+    """
+    :returns list of file diff logs, as given to `parse_lines` by the Miner
+    """
+    with open(corpus_file, "rb") as f:
+        commits = f.read().decode("utf-8", "surrogateescape").split("\x00")
+    files_log = []
+    for commit in commits:
+        lines = commit.splitlines()
+        while lines and not lines[-1]:
+            lines.pop()
+        files_log.extend(log for log in split_diff_log(lines) if log[0][:10] == "diff --git")
+    return files_log
+
+def benchmark(files_log, parsers, repeat=3):
+    """
+    Parse the corpus with every parser, check that they agree and report the best lines/sec.
+    """
+    import time
+    n_lines = sum(len(log) for log in files_log)
+    results, speeds = {}, {}
+    for name, parser in parsers.items():
+        best = None
+        for _ in range(repeat):
+            parsed = []
+            started = time.perf_counter()
+            for log in files_log:
+                state = "start_of_file"
+                for line in log:
+                    try:
+                        state, result = parser(line, state)
+                    except ParseError:
+                        # Same error on every parser, the rest of the file is skipped
+                        result = state = None
+                        parsed.append(result)
+                        break
+                    parsed.append((state, result))
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = parsed
+        speeds[name] = n_lines / best
+        print(f"{name}: {n_lines} lines in {best:.3f}s, {speeds[name]:,.0f} lines/sec")
+
+    reference = next(iter(results.values()))
+    for name, parsed in results.items():
+        if parsed != reference:
+            raise AssertionError(f"{name} disagrees with the other parsers")
+    return speeds
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Diff parsing microbenchmark")
+    parser.add_argument("--corpus", type=str, required=True, help="Recorded `git log -p --format=%%x00` output")
+    parser.add_argument("--record", type=str, default=None, help="Record the corpus from this repository first")
+    parser.add_argument("--max_count", type=int, default=1000, help="Number of commits to record")
+    parser.add_argument("--context", type=int, default=None, help="Diff context of the recorded corpus (default whole files)")
+    parser.add_argument("--repeat", type=int, default=3)
+    params = parser.parse_args()
+
+    if params.record:
+        record_corpus(params.record, params.corpus, params.max_count, 999999999 if params.context is None else params.context)
+    speeds = benchmark(load_corpus(params.corpus), {"regex": parse_line_regex, "fast path": parse_line}, params.repeat)
+    print(f"speedup: {speeds['fast path'] / speeds['regex']:.2f}x")
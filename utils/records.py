@@ -0,0 +1,287 @@
+import json
+import os
+import struct
+from typing import Dict, Iterable, Iterator, List, Optional
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+RECORD_EXTENSION = ".rec"
+INDEX_EXTENSION = ".idx"
+RECORD_MAGIC = b"NCREC\x01"
+RECORD_HEADER = struct.Struct("<II")
+
+# Small fields stored again in front of every record, so that they can be read without decoding the diff and blame
+META_FIELDS = ("commit_id", "parent_id", "author", "date", "files")
+
+CODEC_MSGPACK = b"m"
+CODEC_JSON = b"j"
+
+
+class RecordError(Exception):
+    pass
+
+
+def to_serializable(obj):
+    """
+    `default` hook of the encoders: objects such as the FileDiff of `slotted_aggregator`
+    are serialized through their `to_dict`.
+    """
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+def is_record_file(file_path: str) -> bool:
+    return file_path.endswith(RECORD_EXTENSION)
+
+def index_path(file_path: str) -> str:
+    return file_path + INDEX_EXTENSION
+
+def _encoder(codec: bytes):
+    if codec == CODEC_MSGPACK:
+        packer = msgpack.Packer(use_bin_type=True, unicode_errors="surrogateescape", default=to_serializable)
+        return packer.pack
+    return lambda record: json.dumps(record, separators=(",", ":"), default=to_serializable).encode()
+
+def _decoder(codec: bytes):
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise RecordError("msgpack is required to read this record file")
+        return lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False, unicode_errors="surrogateescape")
+    return json.loads
+
+
+class RecordWriter:
+    """
+    Append records to a length-prefixed binary file and their offsets to a sidecar index.
+
+    File: RECORD_MAGIC, codec byte, then one record after another as
+    [meta length][body length][meta][body], where `meta` holds the META_FIELDS of the
+    record and `body` the whole record. Records are msgpack-encoded when msgpack is
+    installed, compact JSON otherwise.
+    Index: one `commit_id<TAB>offset` line per record.
+    """
+
+    def __init__(self, file_path: str, append: bool = True):
+        """
+        :param str file_path: record file, usually ending with RECORD_EXTENSION
+        :param bool append: keep the records of an existing file, with its codec
+        """
+        self.file_path = file_path
+        if append and os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+            with open(file_path, "rb+") as f:
+                self.codec = read_file_header(f)
+                # Drop a torn last record so that new records are readable
+                f.truncate(complete_size(f))
+            self.file = open(file_path, "ab")
+            self.index = open(index_path(file_path), "a")
+        else:
+            self.codec = CODEC_MSGPACK if msgpack is not None else CODEC_JSON
+            self.file = open(file_path, "wb")
+            self.file.write(RECORD_MAGIC + self.codec)
+            self.index = open(index_path(file_path), "w")
+        self.encode = _encoder(self.codec)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, record: Dict) -> int:
+        """
+        :returns int offset of the record in the file
+        """
+        meta = self.encode({field: record[field] for field in META_FIELDS if field in record})
+        body = self.encode(record)
+        offset = self.file.tell()
+        self.file.write(RECORD_HEADER.pack(len(meta), len(body)))
+        self.file.write(meta)
+        self.file.write(body)
+        if "commit_id" in record:
+            self.index.write(f"{record['commit_id']}\t{offset}\n")
+        return offset
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+
+class RecordReader:
+    """
+    Sequential and random access to a file written by `RecordWriter`.
+    `fields` restricted to META_FIELDS are read without decoding the record body.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.file = open(file_path, "rb")
+        self.codec = read_file_header(self.file)
+        self.decode = _decoder(self.codec)
+        self.data_start = self.file.tell()
+        self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def index(self) -> Dict[str, int]:
+        """
+        {
+            commit_id: offset of its last record
+        }
+        """
+        if self._index is None:
+            self._index = load_index(self.file_path)
+            if self._index is None:
+                self._index = {}
+                for offset, meta in self._scan():
+                    if "commit_id" in meta:
+                        self._index[meta["commit_id"]] = offset
+        return self._index
+
+    def __contains__(self, commit_id: str) -> bool:
+        return commit_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return self.iter()
+
+    def keys(self) -> Iterable[str]:
+        return self.index.keys()
+
+    def _read(self, fields: Optional[List[str]], end: int) -> Optional[Dict]:
+        # Read the record at the current position, None at the end of the file or on a torn record
+        header = self.file.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return None
+        meta_length, body_length = RECORD_HEADER.unpack(header)
+        if self.file.tell() + meta_length + body_length > end:
+            return None
+
+        if fields is not None and all(field in META_FIELDS for field in fields):
+            meta = self.decode(self.file.read(meta_length))
+            self.file.seek(body_length, os.SEEK_CUR)
+            return {field: meta[field] for field in fields if field in meta}
+
+        self.file.seek(meta_length, os.SEEK_CUR)
+        record = self.decode(self.file.read(body_length))
+        if fields is not None:
+            record = {field: record[field] for field in fields if field in record}
+        return record
+
+    def _scan(self) -> Iterator:
+        self.file.seek(self.data_start)
+        end = os.fstat(self.file.fileno()).st_size
+        while True:
+            offset = self.file.tell()
+            meta = self._read(list(META_FIELDS), end)
+            if meta is None:
+                return
+            yield offset, meta
+
+    def iter(self, fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        """
+        Iterate over the records in file order, like `load_jsonl`.
+
+        :param List[str] fields: keep only these fields
+        """
+        self.file.seek(self.data_start)
+        end = os.fstat(self.file.fileno()).st_size
+        while True:
+            record = self._read(fields, end)
+            if record is None:
+                return
+            position = self.file.tell()
+            yield record
+            # The caller may have used random access in between
+            self.file.seek(position)
+
+    def get(self, commit_id: str, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        """
+        Seek straight to the record of a commit.
+
+        :param List[str] fields: keep only these fields
+        :returns Dict the record, None if the commit is not in the file
+        """
+        offset = self.index.get(commit_id)
+        if offset is None:
+            return None
+        end = os.fstat(self.file.fileno()).st_size
+        self.file.seek(offset)
+        meta = self._read(["commit_id"], end)
+        if meta is None or meta.get("commit_id") != commit_id:
+            # Stale entry of a torn record that was written over
+            return None
+        self.file.seek(offset)
+        return self._read(fields, end)
+
+    def __getitem__(self, commit_id: str) -> Dict:
+        record = self.get(commit_id)
+        if record is None:
+            raise KeyError(commit_id)
+        return record
+
+    def close(self):
+        self.file.close()
+
+
+def read_file_header(f) -> bytes:
+    magic = f.read(len(RECORD_MAGIC) + 1)
+    if magic[:-1] != RECORD_MAGIC or magic[-1:] not in (CODEC_MSGPACK, CODEC_JSON):
+        raise RecordError(f"{f.name} is not a record file")
+    return magic[-1:]
+
+def complete_size(f) -> int:
+    """
+    Size of the complete records of a file positioned after its header.
+    """
+    end = os.fstat(f.fileno()).st_size
+    offset = f.tell()
+    while True:
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return offset
+        meta_length, body_length = RECORD_HEADER.unpack(header)
+        next_offset = offset + RECORD_HEADER.size + meta_length + body_length
+        if next_offset > end:
+            return offset
+        f.seek(next_offset)
+        offset = next_offset
+
+def load_index(file_path: str) -> Optional[Dict[str, int]]:
+    """
+    Read the sidecar index of a record file, None if it is missing.
+    """
+    if not os.path.exists(index_path(file_path)):
+        return None
+    index = {}
+    with open(index_path(file_path), "r") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            commit_id, _, offset = line[:-1].partition("\t")
+            if offset.isdigit():
+                index[commit_id] = int(offset)
+    return index
+
+def save_records(data: Iterable[Dict], file_path: str) -> None:
+    with RecordWriter(file_path, append=False) as writer:
+        for record in data:
+            writer.write(record)
+
+def append_records(data: Iterable[Dict], file_path: str) -> None:
+    with RecordWriter(file_path) as writer:
+        for record in data:
+            writer.write(record)
+
+def load_records(file_path: str, fields: Optional[List[str]] = None) -> Iterator[Dict]:
+    with RecordReader(file_path) as reader:
+        yield from reader.iter(fields)
@@ -0,0 +1,140 @@
+import hashlib
+import heapq
+import json
+import os
+from typing import Dict, Iterator, List, Tuple
+
+from utils.records import RecordWriter, is_record_file, load_records
+from utils.utils import load_json, open_file, save_json
+
+SHARD_MANIFEST_NAME = "shard-{}-{}-of-{}.json"
+
+
+class ShardError(Exception):
+    pass
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """
+    Parse `--shard i/N`, where `i` is 0-based.
+    """
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ShardError(f"Expected --shard i/N, got {shard!r}")
+    if count < 1 or not 0 <= index < count:
+        raise ShardError(f"Shard index must be in [0, {count}), got {index}")
+    return index, count
+
+def shard_bounds(total: int, index: int, count: int) -> Tuple[int, int]:
+    """
+    Contiguous [start, end) slice of shard `index` out of `count` over `total` ordered commits.
+    Contiguous slices keep the per-file history of a shard together for blame reuse.
+    """
+    return index * total // count, (index + 1) * total // count
+
+def file_checksum(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def read_shard(path: str) -> Iterator[Tuple[int, object]]:
+    """
+    (date, record) of a shard output: the JSONL line, or the decoded record of a record file.
+    """
+    if is_record_file(path):
+        for record in load_records(path):
+            yield record["date"], record
+        return
+    with open_file(path, "r") as f:
+        for line in f:
+            yield json.loads(line)["date"], line
+
+def write_shard_manifest(out_file: str, manifest_file: str, **meta) -> Dict:
+    """
+    Describe a finished shard output so that it can be validated on another machine.
+
+    :param str out_file: date-ordered JSONL output of the shard
+    :param str manifest_file: where to save the manifest
+    :param meta: repo, tip, shard, shards, total, start, end, first_commit, last_commit, options
+    """
+    count, first_date, last_date = 0, None, None
+    for date, _ in read_shard(out_file):
+        first_date = date if first_date is None else min(first_date, date)
+        last_date = date if last_date is None else max(last_date, date)
+        count += 1
+
+    manifest = dict(meta)
+    manifest.update({
+        "file": os.path.basename(out_file),
+        "records": count,
+        "first_date": first_date,
+        "last_date": last_date,
+        "sha256": file_checksum(out_file),
+    })
+    save_json(manifest, manifest_file)
+    return manifest
+
+def validate_shard_manifests(manifest_files: List[str]) -> List[Dict]:
+    """
+    Check that the shards come from the same repository, tip and partitioning, that they cover
+    the whole commit range exactly once and that every output file matches its checksum.
+
+    :returns List[Dict] manifests ordered by shard index, with the absolute `path` of their output
+    """
+    manifests = []
+    for manifest_file in manifest_files:
+        manifest = load_json(manifest_file)
+        manifest["path"] = os.path.join(os.path.dirname(os.path.abspath(manifest_file)), manifest["file"])
+        manifests.append(manifest)
+    if not manifests:
+        raise ShardError("No shard manifest to merge")
+
+    reference = manifests[0]
+    for key in ("repo", "tip", "shards", "total", "options"):
+        values = {json.dumps(manifest[key], sort_keys=True) for manifest in manifests}
+        if len(values) > 1:
+            raise ShardError(f"Shards disagree on {key}: {sorted(values)}")
+
+    manifests.sort(key=lambda manifest: manifest["shard"])
+    indexes = [manifest["shard"] for manifest in manifests]
+    if indexes != list(range(reference["shards"])):
+        raise ShardError(f"Expected shards 0..{reference['shards'] - 1}, got {indexes}")
+
+    for manifest in manifests:
+        expected = shard_bounds(manifest["total"], manifest["shard"], manifest["shards"])
+        if (manifest["start"], manifest["end"]) != expected:
+            raise ShardError(f"Shard {manifest['shard']} covers {manifest['start']}:{manifest['end']}, expected {expected[0]}:{expected[1]}")
+        if not os.path.exists(manifest["path"]):
+            raise ShardError(f"Missing output of shard {manifest['shard']}: {manifest['path']}")
+        if file_checksum(manifest["path"]) != manifest["sha256"]:
+            raise ShardError(f"Checksum mismatch for shard {manifest['shard']}: {manifest['path']}")
+    return manifests
+
+def merge_shard_outputs(manifest_files: List[str], out_file: str) -> int:
+    """
+    Validate the shards, then k-way merge their date-ordered outputs into `out_file`.
+
+    :returns int number of merged records
+    """
+    manifests = validate_shard_manifests(manifest_files)
+
+    count = 0
+    shards = heapq.merge(*[read_shard(manifest["path"]) for manifest in manifests], key=lambda x: x[0])
+    if is_record_file(out_file):
+        with RecordWriter(out_file, append=False) as writer:
+            for _, record in shards:
+                writer.write(record if isinstance(record, dict) else json.loads(record))
+                count += 1
+    else:
+        with open_file(out_file, "w") as out:
+            for _, record in shards:
+                out.write(record if isinstance(record, str) else json.dumps(record) + "\n")
+                count += 1
+
+    expected = sum(manifest["records"] for manifest in manifests)
+    if count != expected:
+        raise ShardError(f"Merged {count} records, manifests announce {expected}")
+    return count
@@ -0,0 +1,154 @@
+import heapq
+import os
+import resource
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+def current_rss() -> int:
+    """
+    Resident set size of this process in bytes, its peak where /proc is missing.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class CommitStats:
+    """
+    Wall time, bytes read and call count of every stage spent on one commit.
+    """
+
+    def __init__(self, commit_id: str):
+        self.commit_id = commit_id
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.files = 0
+        self.diff_bytes = 0
+        self.stages = {}
+        """
+        {
+            stage: {"calls": int, "seconds": float, "bytes": int}
+        }
+        """
+
+    def add(self, stage: str, seconds: float, nbytes: int = 0, calls: int = 1) -> None:
+        totals = self.stages.setdefault(stage, {"calls": 0, "seconds": 0.0, "bytes": 0})
+        totals["calls"] += calls
+        totals["seconds"] += seconds
+        totals["bytes"] += nbytes
+
+    @contextmanager
+    def stage(self, stage: str):
+        """
+        Time a block; the bytes it reads can be added with `add(stage, 0, nbytes, calls=0)`.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def finish(self, files: int = 0, diff_bytes: int = 0) -> None:
+        self.seconds = time.perf_counter() - self.started
+        self.files = files
+        self.diff_bytes = diff_bytes
+
+    def to_dict(self) -> Dict:
+        return {
+            "commit_id": self.commit_id,
+            "seconds": round(self.seconds, 6),
+            "files": self.files,
+            "diff_bytes": self.diff_bytes,
+            "stages": {stage: dict(totals, seconds=round(totals["seconds"], 6)) for stage, totals in self.stages.items()},
+        }
+
+
+class MinerStats:
+    """
+    Per-stage totals of a worker (or of the whole run once merged) and its slowest commits.
+    Only plain data is kept so that workers can send it back to the parent process.
+    """
+
+    def __init__(self, top: int = 20):
+        """
+        :param int top: number of slowest commits to keep
+        """
+        self.top = top
+        self.commits = 0
+        self.stages = {}
+        """
+        {
+            stage: {"calls": int, "seconds": float, "bytes": int}
+        }
+        """
+        self.counters = {}
+        """
+        {
+            counter: int
+        }
+        """
+        self.slowest = []
+        """
+        min-heap of (seconds, commit_id, CommitStats.to_dict())
+        """
+        # Resident size of the worker when the stats were taken, and the largest one seen
+        self.rss = 0
+        self.peak_rss = 0
+
+    def record(self, commit: CommitStats) -> None:
+        self.commits += 1
+        for stage, totals in commit.stages.items():
+            merged = self.stages.setdefault(stage, {"calls": 0, "seconds": 0.0, "bytes": 0})
+            for key, value in totals.items():
+                merged[key] += value
+        self._keep(commit.seconds, commit.commit_id, commit.to_dict())
+
+    def sample_rss(self) -> int:
+        self.rss = current_rss()
+        self.peak_rss = max(self.peak_rss, self.rss)
+        return self.rss
+
+    def count(self, counter: str, value: int = 1) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def _keep(self, seconds: float, commit_id: str, summary: Dict) -> None:
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, (seconds, commit_id, summary))
+        elif self.top > 0 and (seconds, commit_id) > self.slowest[0][:2]:
+            heapq.heapreplace(self.slowest, (seconds, commit_id, summary))
+
+    def merge(self, other: "MinerStats") -> None:
+        self.commits += other.commits
+        for stage, totals in other.stages.items():
+            merged = self.stages.setdefault(stage, {"calls": 0, "seconds": 0.0, "bytes": 0})
+            for key, value in totals.items():
+                merged[key] += value
+        for counter, value in other.counters.items():
+            self.count(counter, value)
+        self.peak_rss = max(self.peak_rss, other.peak_rss)
+        for seconds, commit_id, summary in other.slowest:
+            self._keep(seconds, commit_id, summary)
+
+    def summary(self, **extra) -> Dict:
+        """
+        Stage times are summed over the commits, so they exceed the wall time with
+        several workers or with `--async_git`.
+        """
+        summary = dict(extra)
+        summary.update({
+            "commits": self.commits,
+            "stages": {
+                stage: dict(totals, seconds=round(totals["seconds"], 6))
+                for stage, totals in sorted(self.stages.items(), key=lambda item: -item[1]["seconds"])
+            },
+            "counters": dict(sorted(self.counters.items())),
+            "peak_worker_rss": self.peak_rss,
+            "slowest_commits": [commit for _, _, commit in sorted(self.slowest, key=lambda item: item[:2], reverse=True)],
+        })
+        return summary
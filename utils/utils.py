@@ -1,24 +1,43 @@
-from typing import List, Dict
+from typing import IO, List, Dict
 import logging as log
 import json, os, uuid
 import re
+import gzip
+import io
 from pathlib import Path
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from utils.records import RecordWriter, is_record_file, load_records, save_records, append_records, to_serializable
+
 PARENT_DIR = Path(__file__).parent.parent
 DEFAULT_LOG = f"{PARENT_DIR}/log"
 DEFAULT_INPUT = f'{PARENT_DIR}/input'
 DEFAULT_EXTRACTED_OUTPUT = f'{PARENT_DIR}/output/extracted'
 DEFAULT_DATA_OUTPUT = f"{PARENT_DIR}/output/dataset"
 
-EXTRACTED_FILE_NAME_PATERN = "{}-.*[.]jsonl$"
+GZIP_EXTENSION = ".gz"
+ZSTD_EXTENSION = ".zst"
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+COMPRESSION_EXTENSIONS = {"gzip": GZIP_EXTENSION, "zstd": ZSTD_EXTENSION}
+ZSTD_LEVEL = 3
+# Compression threads of the zstd writers. 0 compresses in the calling thread, which keeps
+# writers inside worker processes from oversubscribing the CPUs
+ZSTD_THREADS = 0
+
+EXTRACTED_FILE_NAME_PATERN = "{}-.*[.]jsonl(?:[.]gz|[.]zst)?$"
 SIMCOM_PATERN = EXTRACTED_FILE_NAME_PATERN.format("simcom")
 DEEPJIT_PATERN = EXTRACTED_FILE_NAME_PATERN.format("deepjit")
 SECURITY_PATERN = EXTRACTED_FILE_NAME_PATERN.format("security")
 FEATURES_PATERN = EXTRACTED_FILE_NAME_PATERN.format("features")
 VCCFINDER_PATERN = EXTRACTED_FILE_NAME_PATERN.format("vcc-features")
 
-TRUSTED_LABEL_PATERN = "^T_{}.*[.]jsonl$"
-SEMI_TRUSTED_LABEL_PATERN = "^ST_{}.*[.]jsonl$"
+TRUSTED_LABEL_PATERN = "^T_{}.*[.]jsonl(?:[.]gz|[.]zst)?$"
+SEMI_TRUSTED_LABEL_PATERN = "^ST_{}.*[.]jsonl(?:[.]gz|[.]zst)?$"
 
 if not os.path.exists(DEFAULT_EXTRACTED_OUTPUT):
     os.makedirs(DEFAULT_EXTRACTED_OUTPUT)
@@ -53,44 +72,149 @@ def create_log_handler(name: str) -> log.Logger:
     logger.info(f'Logging initialized for {name}')
     return logger
 
+def detect_compression(file_path: str) -> str:
+    """
+    Compression of an existing file from its magic bytes: GZIP_EXTENSION, ZSTD_EXTENSION or "".
+    """
+    with open(file_path, "rb") as f:
+        magic = f.read(len(ZSTD_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        return GZIP_EXTENSION
+    if magic == ZSTD_MAGIC:
+        return ZSTD_EXTENSION
+    return ""
+
+def open_file(file_path: str, mode: str = "r", threads: int = ZSTD_THREADS) -> IO:
+    """
+    `open` with transparent gzip/zstd streams. Writers compress according to the extension
+    of `file_path`, readers detect the compression from the content. Appending adds a new
+    gzip member or zstd frame, which readers go through as one stream.
+
+    :param str mode: "r", "w" or "a", with "b" for a binary stream
+    :param int threads: compression threads of a zstd writer, for a process that writes alone
+    """
+    binary = "b" in mode
+    mode = mode.replace("b", "").replace("t", "")
+    if mode == "r":
+        compression = detect_compression(file_path) if os.path.exists(file_path) else ""
+    else:
+        compression = os.path.splitext(file_path)[1]
+
+    if compression == GZIP_EXTENSION:
+        return gzip.open(file_path, mode + ("b" if binary else "t"), encoding=None if binary else "utf-8")
+    if compression == ZSTD_EXTENSION:
+        if zstandard is None:
+            raise ImportError(f"zstandard is required to open {file_path}")
+        if mode == "r":
+            stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(file_path, "rb"), read_across_frames=True, closefd=True))
+        else:
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=threads)
+            stream = compressor.stream_writer(open(file_path, mode + "b"), closefd=True)
+        return stream if binary else io.TextIOWrapper(stream, encoding="utf-8")
+    return open(file_path, mode + ("b" if binary else ""))
+
 def save_json(data: Dict, output_file: str) -> None:
-    with open(output_file, 'w') as f:
+    with open_file(output_file, 'w') as f:
         json.dump(data, f)
 
 def load_json(file_path: str) -> Dict:
-    with open(file_path, "r") as f:
+    with open_file(file_path, "r") as f:
         out_dict = json.load(f)
     return out_dict
 
 def save_jsonl(data: List[Dict], output_file: str) -> None:
-    with open(output_file, 'w') as f:
+    if is_record_file(output_file):
+        return save_records(data, output_file)
+    with open_file(output_file, 'w') as f:
         for d in data:
-            f.write(json.dumps(d) + '\n')
+            f.write(json.dumps(d, default=to_serializable) + '\n')
 
 def append_jsonl(data: List[Dict], output_file: str) -> None:
-    with open(output_file, 'a') as f:
+    """
+    Open, append and close. A compressed output gets a new gzip member or zstd frame per
+    call, so outputs written one record at a time go through a JsonlWriter instead.
+    """
+    if is_record_file(output_file):
+        return append_records(data, output_file)
+    with open_file(output_file, 'a') as f:
         for d in data:
-            f.write(json.dumps(d) + '\n')
+            f.write(json.dumps(d, default=to_serializable) + '\n')
+
+class JsonlWriter:
+    """
+    Long-lived writer of a JSONL or record output: a compressed output is opened once,
+    with one compressor and one gzip member or zstd frame for all the records written.
+    """
+
+    def __init__(self, output_file: str, append: bool = True, threads: int = ZSTD_THREADS):
+        """
+        :param str output_file: output path, compressed or a record file by its extension
+        :param bool append: keep the records of an existing file
+        :param int threads: compression threads of a zstd output
+        """
+        self.output_file = output_file
+        if is_record_file(output_file):
+            self.records = RecordWriter(output_file, append=append)
+            self.file = None
+        else:
+            self.records = None
+            self.file = open_file(output_file, "a" if append else "w", threads=threads)
+
+    def write(self, record: Dict) -> None:
+        if self.records is not None:
+            self.records.write(record)
+        else:
+            self.file.write(json.dumps(record, default=to_serializable) + '\n')
+
+    def close(self) -> None:
+        if self.records is not None:
+            self.records.close()
+        else:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 def load_jsonl(file_path: str) -> Dict:
-    with open(file_path, "r") as f:
+    if is_record_file(file_path):
+        yield from load_records(file_path)
+        return
+    with open_file(file_path, "r") as f:
         for line in f:
             yield json.loads(line)
 
 def read_jsonl(file_path: str) -> List[Dict]:
+    if is_record_file(file_path):
+        return list(load_records(file_path))
     data = []
-    with open(file_path, "r") as f:
+    with open_file(file_path, "r") as f:
         for line in f:
             data.append(json.loads(line))
     return data
 
 def load_chunk_jsonl(file_path: str, start: int, end: int) -> Dict:
-    with open(file_path, 'r') as file:
-        file.seek(start)
+    # Binary stream: offsets are positions in the uncompressed content
+    with open_file(file_path, 'rb') as file:
+        if file.seekable():
+            file.seek(start)
+        else:
+            # zstd streams can only be read forward
+            skip = start
+            while skip > 0:
+                block = file.read(min(skip, 1 << 20))
+                if not block:
+                    break
+                skip -= len(block)
+        position = start
         if start != 0:
-            file.readline() 
-        while file.tell() < end:
-            line = file.readline().strip()
+            position += len(file.readline())
+        while position < end:
+            line = file.readline()
+            position += len(line)
+            line = line.strip()
             if not line:
                 break
             yield json.loads(line)
@@ -100,7 +224,7 @@ def split_list(lst: List, part: int) -> List[List]:
         return [lst]
     chunk_size = len(lst) // part
     remainder = len(lst) % part
-    result = [lst[i*chunk_size:(i+1)*chunk_size] for i in range(n)]
+    result = [lst[i*chunk_size:(i+1)*chunk_size] for i in range(part)]
     result[-1].extend(lst[part*chunk_size:])
     return result
 